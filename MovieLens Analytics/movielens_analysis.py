@@ -1,7 +1,30 @@
+import csv
+import hashlib
+import heapq
+import io
+import json
+import math
+import mmap
+import os
 import re
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_right
 from collections import defaultdict, Counter, OrderedDict
-from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import compress, repeat
+from collections.abc import Mapping
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+from operator import mul, neg
+from types import MappingProxyType
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import pytest
 
@@ -21,23 +44,42 @@ def read_file(path_to_the_file, count_lines=10):
     except Exception as e:
         raise Exception(f"Произошла ошибка при работе с файлом {path_to_the_file}: {e}")
 
-def read_csv_as_dict(file_path, delimiter=',', encoding='utf-8', count_lines=None, valid_movie_ids=None):
-
-    data = []
+def lines_until(f, end):
+    """
+    Строки двоичного файла f от текущей позиции до байтового смещения end;
+    строка, пересекающая end, обрезается по нему.
+    """
+    position = f.tell()
+    for line in f:
+        position += len(line)
+        if position >= end:
+            yield line[:len(line) - (position - end)]
+            return
+        yield line
+
+def read_csv_chunks(file_path, chunk_size=10000, delimiter=',', encoding='utf-8', count_lines=None, valid_movie_ids=None,
+                    end=None):
+    """
+    Генератор: читает ratings.csv/tags.csv построчно и отдает пачки
+    по chunk_size строк (список словарей). В памяти держится только одна пачка.
+    end — байтовое смещение, дальше которого файл не читается (строки,
+    дописанные во время чтения, остаются для read_csv_tail).
+    """
     n1 = ['userId','movieId','rating','timestamp']
     n2 = ['userId','movieId','tag','timestamp']
     try:
-        with open(file_path, 'r', encoding=encoding) as f:
+        with open(file_path, 'rb') as f:
 
-            headers = [h.strip() for h in f.readline().strip().split(delimiter)]
+            headers = [h.strip() for h in f.readline().decode(encoding).strip().split(delimiter)]
             if headers != n1 and headers != n2:
                 raise Exception("error header")
             if (len(headers)) != 4:
                 raise Exception("Error")
-                
 
+            chunk = []
             line_count = 0
-            for line in f:
+            for line in (f if end is None else lines_until(f, end)):
+                line = line.decode(encoding)
                 if count_lines and line_count >= count_lines:
                     break
                 if not line.strip():
@@ -45,7 +87,7 @@ def read_csv_as_dict(file_path, delimiter=',', encoding='utf-8', count_lines=Non
 
                 values = [v.strip() for v in line.strip().split(delimiter)]
                 if len(values) != len(headers):
-                    continue    
+                    continue
                 row = dict(zip(headers, values))
 
                 # фильтрация по movieId
@@ -57,17 +99,347 @@ def read_csv_as_dict(file_path, delimiter=',', encoding='utf-8', count_lines=Non
                     except Exception:
                         continue  # Пропускаем если нет movieId или он не число
 
-                data.append(row)
+                chunk.append(row)
                 line_count += 1
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+    except FileNotFoundError:
+        print(f"Файл не найден: {file_path}")
+    except Exception as e:
+        print(f"Ошибка при чтении файла: {e}")
+
+def read_csv_tail(file_path, offset, delimiter=',', encoding='utf-8'):
+    """
+    Строки ratings.csv/tags.csv, дописанные после байтового смещения offset
+    (0 — с начала файла). Недописанная последняя строка не читается.
+    Возвращает (список словарей, смещение конца прочитанного). Если файл
+    стал короче offset (перезаписан или ротирован), бросает ValueError —
+    дочитывать его хвост уже нельзя, нужна полная перезагрузка.
+    """
+    rows = []
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        size = None
+    if size is not None and size < offset:
+        raise ValueError(f"Файл {file_path} короче прочитанного ({size} < {offset} байт): нужна полная перезагрузка")
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.readline()
+            headers = [h.strip() for h in header.decode(encoding).strip().split(delimiter)]
+            if len(headers) != 4 or headers[:2] != ['userId', 'movieId'] or headers[3] != 'timestamp':
+                raise Exception("error header")
+            f.seek(max(offset, len(header)))
+            data = f.read()
     except FileNotFoundError:
         print(f"Файл не найден: {file_path}")
+        return rows, offset
     except Exception as e:
         print(f"Ошибка при чтении файла: {e}")
+        return rows, offset
+    complete = data.rfind(b'\n') + 1
+    for line in data[:complete].decode(encoding).splitlines():
+        values = [v.strip() for v in line.strip().split(delimiter)]
+        if len(values) == len(headers):
+            rows.append(dict(zip(headers, values)))
+    return rows, max(offset, len(header)) + complete
 
+def read_csv_as_dict(file_path, delimiter=',', encoding='utf-8', count_lines=None, valid_movie_ids=None):
+    data = []
+    for chunk in read_csv_chunks(file_path, delimiter=delimiter, encoding=encoding,
+                                 count_lines=count_lines, valid_movie_ids=valid_movie_ids):
+        data.extend(chunk)
     return data
 
+def split_byte_ranges(file_path, parts, end=None):
+    """
+    Делит файл (без строки заголовка) на parts диапазонов [start, end),
+    границы которых выровнены по началу строки; end ограничивает файл.
+    """
+    with open(file_path, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        if end is not None:
+            size = min(size, end)
+        bounds = [data_start]
+        step = max(1, (size - data_start) // max(1, parts))
+        for i in range(1, parts):
+            target = data_start + i * step
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()  # дочитываем строку, в которую попала граница
+            if f.tell() >= size:
+                break
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+        bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+_worker_movie_ids = None
+
+def _init_parse_worker(valid_movie_ids):
+    global _worker_movie_ids
+    _worker_movie_ids = valid_movie_ids
+
+def _parse_byte_range(task):
+    """
+    Разбирает кусок ratings.csv/tags.csv в колонки. Правила пропуска строк
+    такие же, как в read_csv_chunks и конструкторах Ratings/Tags.
+    """
+    file_path, start, end, kind, delimiter, encoding = task
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode(encoding)
+    user_ids, movie_ids, values, timestamps, tags = array('i'), array('i'), array('f'), array('q'), []
+    for line in io.StringIO(text, newline=None):
+        if not line.strip():
+            continue
+        row = [v.strip() for v in line.strip().split(delimiter)]
+        if len(row) != 4:
+            continue
+        try:
+            movie_id = int(row[1])
+        except ValueError:
+            continue
+        if _worker_movie_ids is not None and movie_id not in _worker_movie_ids:
+            continue
+        try:
+            if kind == "rating":
+                user_id, rating, timestamp = int(row[0]), float(row[2]), int(row[3])
+            elif row[2]:
+                movie_ids.append(movie_id)
+                tags.append(row[2])
+                continue
+            else:
+                continue
+        except ValueError as e:
+            print(f"Ошибка при чтении файла: {e}")
+            continue
+        user_ids.append(user_id)
+        movie_ids.append(movie_id)
+        values.append(rating)
+        timestamps.append(timestamp)
+    if kind == "rating":
+        return {"userId": user_ids, "movieId": movie_ids, "rating": values, "timestamp": timestamps}
+    return {"movieId": movie_ids, "tag": tags}
+
+def read_columns_parallel(file_path, workers=None, valid_movie_ids=None, delimiter=',', encoding='utf-8',
+                          end=None):
+    """
+    Параллельно разбирает весь ratings.csv или tags.csv (до смещения end)
+    пулом процессов: файл делится на выровненные по строкам диапазоны байт,
+    куски колонок склеиваются в исходном порядке. Возвращает dict колонок:
+    userId/movieId/rating/timestamp для оценок или movieId/tag для тегов.
+    """
+    n1 = ['userId','movieId','rating','timestamp']
+    n2 = ['userId','movieId','tag','timestamp']
+    with open(file_path, 'r', encoding=encoding) as f:
+        headers = [h.strip() for h in f.readline().strip().split(delimiter)]
+    if headers not in (n1, n2):
+        raise ValueError("error header")
+    kind = headers[2]
+    workers = workers or os.cpu_count() or 1
+    tasks = [(file_path, start, end, kind, delimiter, encoding)
+             for start, end in split_byte_ranges(file_path, workers * 4, end)]
+    movie_ids = frozenset(valid_movie_ids) if valid_movie_ids is not None else None
+
+    columns = None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                             initargs=(movie_ids,)) as pool:
+        for part in pool.map(_parse_byte_range, tasks):
+            if columns is None:
+                columns = part
+            else:
+                for name, values in part.items():
+                    columns[name].extend(values)
+    if columns is None:
+        columns = _parse_byte_range((file_path, 0, 0, kind, delimiter, encoding))
+    return columns
+
+def with_offset(columns, offset):
+    """
+    Колонки для SidecarCache вместе со смещением, до которого прочитан файл.
+    """
+    return columns if offset is None else dict(columns, offset=array('q', [offset]))
+
+def extract_year_from_title(title):
+    if not title or not isinstance(title, str):
+        return None
+    start = title.rfind("(")
+    end = title.rfind(")")
+    if start != -1 and end != -1 and end > start:
+        year_str = title[start + 1:end]
+        if year_str.isdigit() and len(year_str) == 4:
+            return int(year_str)
+    return None
+
+
+def year_month_columns(timestamps, tz=timezone.utc):
+    """
+    Год и месяц для каждой unix-метки в часовом поясе tz одним проходом:
+    datetime строится только для начала каждого месяца в диапазоне меток, а
+    сами метки раскладываются по месяцам бинарным поиском.
+    Возвращает (array('H') годов, array('B') месяцев).
+    """
+    years, months = array('H'), array('B')
+    if not len(timestamps):
+        return years, months
+    first = datetime.fromtimestamp(min(timestamps), tz=tz)
+    last = datetime.fromtimestamp(max(timestamps), tz=tz)
+    start = first.year * 12 + first.month - 1
+    end = last.year * 12 + last.month - 1
+    boundaries = [datetime(m // 12, m % 12 + 1, 1, tzinfo=tz).timestamp() for m in range(start, end + 1)]
+    indexes = [start + bisect_right(boundaries, ts) - 1 for ts in timestamps]
+    years.extend(m // 12 for m in indexes)
+    months.extend(m % 12 + 1 for m in indexes)
+    return years, months
+
+
+PERIODS = ("day", "week", "month")
+
+
+def period_start(day, period):
+    """
+    Первый день периода ("day", "week" с понедельника или "month"), в который попадает day.
+    """
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(start, period):
+    if period == "day":
+        return start + timedelta(days=1)
+    if period == "week":
+        return start + timedelta(days=7)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def period_columns(timestamps, period="day", tz=timezone.utc):
+    """
+    Период каждой unix-метки в часовом поясе tz — date.toordinal() его
+    первого дня. Как в year_month_columns, datetime строится только для
+    границ периодов, а метки раскладываются бинарным поиском.
+    Возвращает array('i').
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period должен быть одним из {PERIODS}, а не {period!r}")
+    keys = array('i')
+    if not len(timestamps):
+        return keys
+    start = period_start(datetime.fromtimestamp(min(timestamps), tz=tz).date(), period)
+    last = datetime.fromtimestamp(max(timestamps), tz=tz).date()
+    starts = []
+    while start <= last:
+        starts.append(start)
+        start = next_period(start, period)
+    boundaries = [datetime(s.year, s.month, s.day, tzinfo=tz).timestamp() for s in starts]
+    ordinals = [s.toordinal() for s in starts]
+    keys.extend(ordinals[bisect_right(boundaries, ts) - 1] for ts in timestamps)
+    return keys
+
+
+def sums_variance(count, total, sum_sq):
+    """
+    Выборочная дисперсия по количеству, сумме и сумме квадратов. Для оценок
+    на сетке полузвезд суммы точны, и результат — точная дисперсия с одним
+    округлением (как statistics.variance), поэтому округление до сотых не
+    зависит от порядка оценок.
+    """
+    if count < 2:
+        return 0
+    return max(0.0, (count * sum_sq - total * total) / (count * (count - 1)))
+
+
+class RunningStats:
+    """
+    Потоковые count/mean/variance: значения подаются по одному (add) или
+    пачками (update), частичные состояния из разных чанков или процессов
+    объединяются через merge. Пока все значения на сетке полузвезд,
+    дисперсия считается по точным суммам (sums_variance), иначе — по
+    состоянию алгоритма Уэлфорда.
+    """
+    __slots__ = ("count", "total", "_sum_sq", "_grid", "_mean", "_m2")
+
+    def __init__(self, values=()):
+        self.count = 0
+        self.total = 0
+        self._sum_sq = 0
+        self._grid = True
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.update(values)
+
+    def add(self, x):
+        self.count += 1
+        self.total += x
+        self._sum_sq += x * x
+        if self._grid and (x * 2) % 1:
+            self._grid = False
+        delta = x - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (x - self._mean)
+
+    def update(self, values):
+        for x in values:
+            self.add(x)
+        return self
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.total, self._mean, self._m2 = other.count, other.total, other._mean, other._m2
+            self._sum_sq, self._grid = other._sum_sq, other._grid
+            return self
+        count = self.count + other.count
+        delta = other._mean - self._mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self._mean += delta * other.count / count
+        self.count = count
+        self.total += other.total
+        self._sum_sq += other._sum_sq
+        self._grid = self._grid and other._grid
+        return self
+
+    @property
+    def mean(self):
+        # через сумму, чтобы совпадать с sum(lst) / len(lst)
+        return self.total / self.count if self.count else 0
+
+    @property
+    def variance(self):
+        if self._grid:
+            return sums_variance(self.count, self.total, self._sum_sq)
+        return self._m2 / (self.count - 1) if self.count > 1 else 0
+
+
 def mean(lst):
-    return sum(lst) / len(lst) if lst else 0
+    return RunningStats(lst).mean
+
+
+def by_value(item):
+    return item[1]
+
+
+def top_n(items, n, key=by_value, reverse=True):
+    """
+    Первые n элементов items по key (по умолчанию — пары (ключ, значение)
+    по значению) через частичный отбор на куче за O(N log n). Результат и
+    порядок при равных ключах те же, что у sorted(items, key=key, reverse=reverse)[:n].
+    """
+    if n < 0:
+        # срез с отрицательным n отбрасывает хвост — частичный отбор тут не поможет
+        return sorted(items, key=key, reverse=reverse)[:n]
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    return select(n, items, key=key)
 
 def median(lst):
     lst = sorted(lst)
@@ -81,23 +453,701 @@ def median(lst):
         return lst[mid]
 
 def variance(lst):
+    # список уже в памяти — два прохода, как и раньше
     n = len(lst)
     if n < 2:
         return 0
     avg = mean(lst)
     return sum((x - avg) ** 2 for x in lst) / (n - 1)
 
+
+class RatingHistogram:
+    """
+    Гистограмма оценок по десяти корзинам 0.5, 1.0, ..., 5.0. Медиана и любые
+    квантили считаются по ней точно и без сортировки; оценки вне сетки
+    полузвезд хранятся отдельно, поэтому результат остается точным и для них.
+    Гистограммы разных групп складываются через merge.
+    """
+    __slots__ = ("buckets", "other", "count")
+
+    def __init__(self, values=()):
+        self.buckets = [0] * 10
+        self.other = {}
+        self.count = 0
+        for x in values:
+            self.add(x)
+
+    def add(self, x, count=1):
+        doubled = x * 2
+        if doubled == int(doubled) and 1 <= doubled <= 10:
+            self.buckets[int(doubled) - 1] += count
+        else:
+            self.other[x] = self.other.get(x, 0) + count
+        self.count += count
+
+    def merge(self, other):
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        for x, count in other.other.items():
+            self.other[x] = self.other.get(x, 0) + count
+        self.count += other.count
+        return self
+
+    def items(self):
+        """
+        Пары (оценка, количество) по возрастанию оценки.
+        """
+        pairs = [((i + 1) / 2, count) for i, count in enumerate(self.buckets) if count]
+        if self.other:
+            pairs = sorted(pairs + list(self.other.items()))
+        return pairs
+
+    def quantile(self, q):
+        """
+        Квантиль q из [0, 1] с линейной интерполяцией между соседними
+        значениями (q=0.5 совпадает с median()); 0 для пустой гистограммы.
+        """
+        if not self.count:
+            return 0
+        position = q * (self.count - 1)
+        low = int(position)
+        high = min(low + 1, self.count - 1)
+        low_value = high_value = None
+        seen = 0
+        for value, count in self.items():
+            seen += count
+            if low_value is None and low < seen:
+                low_value = value
+            if high < seen:
+                high_value = value
+                break
+        if position == low:
+            return low_value
+        return low_value + (high_value - low_value) * (position - low)
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+class KllSketch:
+    """
+    Потоковый квантильный скетч KLL для произвольных значений: уровни
+    сжимаются вдвое (из отсортированного уровня наверх уходит каждый второй
+    элемент с весом 2^уровень), поэтому память O(k) независимо от числа
+    значений. Скетчи объединяются через merge.
+    Пока значений меньше k, сжатий не было и quantile точен (совпадает с
+    median()). Дальше нормированная ошибка ранга порядка 1.65% при k=200
+    (оценка KLL с вероятностью 99%) и убывает примерно как 1/k.
+    """
+    __slots__ = ("k", "levels", "count", "_flip")
+
+    def __init__(self, k=200, values=()):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self._flip = 0
+        for x in values:
+            self.add(x)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, math.ceil(self.k * (2 / 3) ** depth))
+
+    def _full(self):
+        return sum(map(len, self.levels)) >= sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def _compress(self):
+        while self._full():
+            for level, items in enumerate(self.levels):
+                if len(items) < self._capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                leftover = [items.pop()] if len(items) % 2 else []
+                self._flip ^= 1
+                self.levels[level + 1].extend(items[self._flip::2])
+                self.levels[level] = leftover
+                break
+
+    def add(self, x):
+        self.levels[0].append(x)
+        self.count += 1
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """
+        Квантиль q из [0, 1]; 0 для пустого скетча.
+        """
+        if not self.count:
+            return 0
+        if len(self.levels) == 1:
+            # сжатий не было — все значения на месте
+            values = sorted(self.levels[0])
+            position = q * (len(values) - 1)
+            low = int(position)
+            high = min(low + 1, len(values) - 1)
+            t = position - low
+            return values[low] if not t else values[low] * (1 - t) + values[high] * t
+        weighted = sorted((x, 1 << level) for level, items in enumerate(self.levels) for x in items)
+        target = q * (self.count - 1)
+        seen = 0
+        for x, weight in weighted:
+            seen += weight
+            if seen > target:
+                return x
+        return weighted[-1][0]
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+def quantile_counter(quantiles="exact", k=200):
+    """
+    Фабрика распределений по группам для квантилей: RatingHistogram для
+    quantiles="exact", KllSketch(k) для "sketch".
+    """
+    if quantiles == "exact":
+        return RatingHistogram
+    if quantiles == "sketch":
+        return lambda: KllSketch(k)
+    raise ValueError(f"quantiles должен быть 'exact' или 'sketch', а не {quantiles!r}")
+
+
+def chunk_columns(chunk, *keys):
+    """
+    Колонки (key..., rating) пачки строк read_csv_chunks, по одной на каждый
+    ключ из keys; битые строки пропускаются.
+    """
+    columns = [[] for _ in range(len(keys) + 1)]
+    for row in chunk:
+        try:
+            values = [int(row[key]) for key in keys]
+            values.append(float(row["rating"]))
+        except Exception as e:
+            print(f"Ошибка при чтении строки: {row}, ошибка: {e}")
+            continue
+        for column, value in zip(columns, values):
+            column.append(value)
+    return columns
+
+
+MASK64 = (1 << 64) - 1
+
+
+def splitmix64(x):
+    """
+    64-битный хэш целого (финализатор SplitMix64).
+    """
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+class HyperLogLog:
+    """
+    Приближенный счетчик различных значений. error — относительная
+    стандартная ошибка, по ней выбирается число регистров m = 2^precision
+    (ошибка ~ 1.04 / sqrt(m)). Пока значений мало, регистры хранятся
+    разреженно (dict), поэтому маленькие скетчи занимают мало памяти.
+    Скетчи с одинаковой точностью объединяются через merge или |=.
+    """
+    __slots__ = ("precision", "registers", "_sparse")
+
+    def __init__(self, error=0.01, values=()):
+        self.precision = min(18, max(4, math.ceil(math.log2((1.04 / error) ** 2))))
+        self.registers = None
+        self._sparse = {}
+        for value in values:
+            self.add(value)
+
+    @staticmethod
+    def _hash(value):
+        if isinstance(value, int):
+            return splitmix64(value)
+        return int.from_bytes(hashlib.sha1(repr(value).encode()).digest()[:8], 'little')
+
+    def _densify(self):
+        self.registers = bytearray(1 << self.precision)
+        for index, rank in self._sparse.items():
+            self.registers[index] = rank
+        self._sparse = None
+
+    def add(self, value):
+        h = self._hash(value)
+        p = self.precision
+        index = h >> (64 - p)
+        rank = 64 - p - (h & ((1 << (64 - p)) - 1)).bit_length() + 1
+        if self.registers is None:
+            if rank > self._sparse.get(index, 0):
+                self._sparse[index] = rank
+                if len(self._sparse) > (1 << p) // 16:
+                    self._densify()
+        elif rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Нельзя объединить HyperLogLog с разной точностью")
+        if other.registers is None:
+            for index, rank in other._sparse.items():
+                if self.registers is None:
+                    if rank > self._sparse.get(index, 0):
+                        self._sparse[index] = rank
+                elif rank > self.registers[index]:
+                    self.registers[index] = rank
+            if self.registers is None and len(self._sparse) > (1 << self.precision) // 16:
+                self._densify()
+        else:
+            if self.registers is None:
+                self._densify()
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    __ior__ = merge
+
+    def copy(self):
+        sketch = HyperLogLog.__new__(HyperLogLog)
+        sketch.precision = self.precision
+        sketch.registers = None if self.registers is None else bytearray(self.registers)
+        sketch._sparse = None if self._sparse is None else dict(self._sparse)
+        return sketch
+
+    def count(self):
+        m = 1 << self.precision
+        ranks = self._sparse.values() if self.registers is None else self.registers
+        zeros = m - len(self._sparse) if self.registers is None else self.registers.count(0)
+        total = zeros + sum(2.0 ** -rank for rank in ranks if rank)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / total
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # линейный подсчет для малых множеств
+        return estimate
+
+    def __len__(self):
+        return round(self.count())
+
+
+def distinct_counter(distinct="exact", error=0.01):
+    """
+    Фабрика счетчиков различных пользователей: set для distinct="exact",
+    HyperLogLog с ошибкой error для "approx".
+    """
+    if distinct == "exact":
+        return set
+    if distinct == "approx":
+        return lambda: HyperLogLog(error)
+    raise ValueError(f"distinct должен быть 'exact' или 'approx', а не {distinct!r}")
+
+
+def metric_quantile(metric):
+    """
+    Квантиль для параметра metric: None для "average", 0.5 для "median",
+    NN / 100 для "pNN" (например, "p90").
+    """
+    if metric == "average":
+        return None
+    if isinstance(metric, str) and metric[:1] == "p" and metric[1:].replace(".", "", 1).isdigit():
+        q = float(metric[1:]) / 100
+        if q > 1:
+            raise ValueError(f"Неверный перцентиль: {metric}")
+        return q
+    return 0.5
+
+CACHE_SUFFIX = ".mlcache"
+CACHE_MAGIC = b"MLCACHE1"
+CACHE_HASH_BYTES = 1 << 16
+
+
+def file_fingerprint(path):
+    """
+    Отпечаток исходного файла: размер, mtime и sha1 от первых и последних
+    CACHE_HASH_BYTES байт (полное хэширование больших файлов слишком дорогое).
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read(CACHE_HASH_BYTES))
+        if stat.st_size > CACHE_HASH_BYTES:
+            f.seek(max(CACHE_HASH_BYTES, stat.st_size - CACHE_HASH_BYTES))
+            digest.update(f.read())
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest.hexdigest()}
+
+def ids_digest(ids):
+    if ids is None:
+        return None
+    return hashlib.sha1(",".join(map(str, sorted(ids))).encode()).hexdigest()
+
+def _align8(n):
+    return (n + 7) & ~7
+
+
+class SidecarCache:
+    """
+    Бинарный кэш разобранного CSV рядом с исходным файлом: <file>.<key>.mlcache,
+    или в каталоге cache_dir, если рядом с данными писать нельзя.
+    Числовые колонки (array) пишутся как есть и при чтении отображаются в память
+    через mmap без копирования; строковые колонки хранятся как utf-8 блоб и смещения.
+    Кэш считается устаревшим, если у исходного файла изменился размер, mtime или хэш.
+    """
+    def __init__(self, source_path, key, cache_dir=None):
+        self.source_path = source_path
+        if cache_dir is None:
+            digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+            self.path = f"{source_path}.{digest}{CACHE_SUFFIX}"
+        else:
+            # в общем каталоге кэши одноименных файлов различаются по полному пути
+            digest = hashlib.sha1(repr((key, os.path.abspath(source_path))).encode()).hexdigest()[:12]
+            self.path = os.path.join(cache_dir, f"{os.path.basename(source_path)}.{digest}{CACHE_SUFFIX}")
+
+    def load(self):
+        """
+        Возвращает dict {имя колонки: memoryview или list[str]} либо None,
+        если кэша нет или он устарел. Отображение закрывается сразу, если
+        на него не ссылается ни одна числовая колонка, иначе — когда
+        освобождается последняя из них.
+        """
+        try:
+            fingerprint = file_fingerprint(self.source_path)
+            with open(self.path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        view = memoryview(buffer)
+        columns = None
+        try:
+            if bytes(view[:8]) != CACHE_MAGIC:
+                return None
+            header_len = int.from_bytes(view[8:16], 'little')
+            header = json.loads(bytes(view[16:16 + header_len]))
+            if header["source"] != fingerprint or header["byteorder"] != sys.byteorder:
+                return None
+            data_start = _align8(16 + header_len)
+
+            def column(meta):
+                if array(meta["typecode"]).itemsize != meta["itemsize"]:
+                    raise ValueError("itemsize mismatch")
+                start = data_start + meta["offset"]
+                return view[start:start + meta["nbytes"]].cast(meta["typecode"])
+
+            columns = {}
+            for meta in header["columns"]:
+                if meta["kind"] == "array":
+                    columns[meta["name"]] = column(meta)
+                else:
+                    offsets = column(meta["offsets"])
+                    blob = bytes(column(meta["blob"]))
+                    columns[meta["name"]] = [
+                        blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+                        for i in range(len(offsets) - 1)
+                    ]
+                    offsets.release()
+            return columns
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Кэш {self.path} поврежден и будет пересобран: {e}")
+            columns = None
+            return None
+        finally:
+            if columns is None or not any(isinstance(c, memoryview) for c in columns.values()):
+                view.release()
+                try:
+                    buffer.close()
+                except BufferError:
+                    pass  # на отображение еще ссылается срез — закроется вместе с ним
+
+    def save(self, columns):
+        """
+        columns — dict {имя: array или список строк}.
+        Ошибки записи не фатальны: данные просто не кэшируются.
+        """
+        try:
+            fingerprint = file_fingerprint(self.source_path)
+        except OSError:
+            return
+        blocks = []
+        metas = []
+        offset = 0
+
+        def add_block(values):
+            nonlocal offset
+            meta = {"typecode": values.typecode, "itemsize": values.itemsize,
+                    "offset": offset, "nbytes": len(values) * values.itemsize}
+            blocks.append((offset, values))
+            offset = _align8(offset + meta["nbytes"])
+            return meta
+
+        for name, values in columns.items():
+            if isinstance(values, array):
+                metas.append(dict(add_block(values), name=name, kind="array"))
+            else:
+                encoded = [v.encode('utf-8') for v in values]
+                offsets = array('q', [0])
+                total = 0
+                for item in encoded:
+                    total += len(item)
+                    offsets.append(total)
+                metas.append({"name": name, "kind": "str", "offsets": add_block(offsets),
+                              "blob": add_block(array('B', b"".join(encoded)))})
+
+        header = json.dumps({"source": fingerprint, "byteorder": sys.byteorder,
+                             "columns": metas}).encode()
+        data_start = _align8(16 + len(header))
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(CACHE_MAGIC)
+                f.write(len(header).to_bytes(8, 'little'))
+                f.write(header)
+                for block_offset, values in blocks:
+                    f.write(b"\0" * (data_start + block_offset - f.tell()))
+                    values.tofile(f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Не удалось записать кэш {self.path}: {e}")
+
+
+class ImdbCache:
+    """
+    Локальный кэш IMDb в SQLite по imdbId: исходный HTML страницы и разобранная
+    запись __Make_dict (JSON). Записи старше ttl секунд считаются устаревшими
+    (ttl=None — хранить бессрочно).
+    """
+    def __init__(self, path, ttl=7 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "imdb_id TEXT PRIMARY KEY, html TEXT, record TEXT, fetched_at REAL)"
+            )
+
+    def _get(self, imdb_id, column):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {column}, fetched_at FROM pages WHERE imdb_id = ?", (imdb_id,)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        if self.ttl is not None and time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def get_html(self, imdb_id):
+        return self._get(imdb_id, "html")
+
+    def get_record(self, imdb_id):
+        record = self._get(imdb_id, "record")
+        return json.loads(record) if record is not None else None
+
+    def put_html(self, imdb_id, html):
+        """
+        Новая страница сбрасывает разобранную запись.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (imdb_id, html, record, fetched_at) VALUES (?, ?, NULL, ?)",
+                (imdb_id, html, time.time())
+            )
+
+    def put_record(self, imdb_id, record):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE pages SET record = ? WHERE imdb_id = ?", (json.dumps(record), imdb_id)
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+# кэш IMDb для вызовов без своего fetcher (default_fetcher)
+IMDB_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "movielens", "imdb.sqlite")
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def default_fetcher():
+    """
+    Общий для процесса ImdbFetcher: один requests.Session с пулом соединений
+    и ImdbCache в IMDB_CACHE_PATH, поэтому недавно скачанные страницы не
+    запрашиваются повторно. Если кэш не открывается, fetcher работает без него.
+    """
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            try:
+                os.makedirs(os.path.dirname(IMDB_CACHE_PATH), exist_ok=True)
+                cache = ImdbCache(IMDB_CACHE_PATH)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Кэш IMDb недоступен: {e}")
+                cache = None
+            _default_fetcher = ImdbFetcher(cache=cache)
+        return _default_fetcher
+
+
+class ImdbFetcher:
+    """
+    Параллельная загрузка страниц IMDb пулом потоков. Все запросы идут через
+    один requests.Session с пулом keep-alive соединений, не чаще
+    requests_per_second в секунду; сетевые ошибки и ответы 429/5xx
+    повторяются с экспоненциальной задержкой.
+    С cache (ImdbCache) страницы сначала ищутся в кэше; offline=True запрещает
+    сеть и отдает только закэшированные страницы.
+    """
+    URL = 'https://www.imdb.com/title/tt{}/'
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
+        'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+        'Referer': 'https://www.imdb.com/title/',
+        'Upgrade-Insecure-Requests': '1'
+    }
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_workers=8, requests_per_second=5.0, retries=3, backoff=0.5, timeout=10,
+                 cache=None, offline=False):
+        self.cache = cache
+        self.offline = offline
+        self.max_workers = max_workers
+        self.requests_per_second = requests_per_second
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(ImdbFetcher.HEADERS)
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def _wait_for_slot(self):
+        if not self.requests_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.requests_per_second
+        if slot > now:
+            time.sleep(slot - now)
+
+    def fetch(self, imdb_id):
+        """
+        HTML страницы фильма; после исчерпания повторов бросает Exception.
+        """
+        if self.cache is not None:
+            html = self.cache.get_html(imdb_id)
+            if html is not None:
+                return html
+        if self.offline:
+            raise Exception(f'No cached page for {imdb_id} in offline mode')
+        html = self._download(imdb_id)
+        if self.cache is not None:
+            self.cache.put_html(imdb_id, html)
+        return html
+
+    def _download(self, imdb_id):
+        for attempt in range(self.retries + 1):
+            self._wait_for_slot()
+            try:
+                page = self.session.get(ImdbFetcher.URL.format(imdb_id), timeout=self.timeout)
+                if page.status_code == 200:
+                    return page.text
+                error = Exception(f'Error page: {page.status_code}')
+                if page.status_code not in ImdbFetcher.RETRY_STATUSES:
+                    raise error
+            except requests.RequestException as e:
+                error = e
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        raise error
+
+    def fetch_many(self, list_of_movies):
+        """
+        dict {imdbId: html или Exception} в порядке list_of_movies.
+        """
+        def fetch_one(imdb_id):
+            try:
+                return self.fetch(imdb_id)
+            except Exception as e:
+                return e
+
+        movies = list(dict.fromkeys(list_of_movies))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return dict(zip(movies, pool.map(fetch_one, movies)))
+
+
 class Links:
     """
     Analyzing data from links.csv
     """
-    def __init__(self, path_to_the_file):
+    IMDB_FIELDS = ['Director', 'Budget', 'Gross worldwide', 'Gross US & Canada',
+                   'Opening weekend US & Canada', 'Runtime', 'Title']
+    # узлы страницы IMDb, которые читают __Make_dict, __extract_rating и get_imdb_rating:
+    # (регулярка начала элемента, нужны ли все совпадения или только первое)
+    PAGE_FRAGMENTS = [
+        (re.compile(r'<title[\s>]', re.I), False),
+        (re.compile(r'<h1[\s>]', re.I), False),
+        (re.compile(r'<li\b[^>]*data-testid=["\']title-pc-principal-credit["\']', re.I), False),
+        (re.compile(r'<li\b[^>]*data-testid=["\']title-techspec_runtime["\']', re.I), False),
+        (re.compile(r'<li\b[^>]*data-testid=["\'][^"\']*title-boxoffice', re.I), True),
+    ]
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+    def __init__(self, path_to_the_file, use_cache=True, fetcher=None, cache_dir=None):
         """
         Put here any fields that you think you will need.
+        fetcher — ImdbFetcher с настройками параллельности и лимита запросов
+        (по умолчанию общий default_fetcher с кэшем на диске).
+        cache_dir — каталог для SidecarCache (по умолчанию рядом с файлом).
         """
         self._path_to_the_file = path_to_the_file
-        self.dict_file = Links.read_csv_column(path_to_the_file, 'imdbId')
-        self.imdb_info = self.__imdb_getter()
+        self.fetcher = fetcher or default_fetcher()
+        # у объекта методы IMDb работают через его fetcher (и его кэш)
+        self.get_imdb = partial(Links.get_imdb, fetcher=self.fetcher)
+        self.get_imdb_rating = partial(Links.get_imdb_rating, fetcher=self.fetcher)
+        cache = SidecarCache(path_to_the_file, ("links", "imdbId"), cache_dir) if use_cache else None
+        columns = cache.load() if cache else None
+        if columns is not None:
+            self.dict_file = columns["imdbId"]
+        else:
+            self.dict_file = Links.read_csv_column(path_to_the_file, 'imdbId')
+            if cache:
+                cache.save({"imdbId": self.dict_file})
+        # данные IMDb загружаются лениво и запоминаются по imdbId
+        self._imdb_records = {}
+        self._imdb_info = None
+
+    @property
+    def imdb_info(self):
+        """
+        Строки [imdbId, *IMDB_FIELDS] для первых 10 фильмов; страницы IMDb
+        скачиваются при первом обращении, а не в конструкторе.
+        """
+        if self._imdb_info is None:
+            self._imdb_info = self.__imdb_getter()
+        return self._imdb_info
+
+    def load_imdb_info(self, list_of_movies):
+        """
+        Строки [imdbId, *IMDB_FIELDS] для выбранных imdbId, отсортированные по убыванию id.
+        Уже загруженные фильмы повторно не скачиваются.
+        """
+        missing = [movie for movie in dict.fromkeys(list_of_movies) if movie not in self._imdb_records]
+        if missing:
+            for row in Links.get_imdb(missing, Links.IMDB_FIELDS, fetcher=self.fetcher):
+                self._imdb_records[row[0]] = row
+        rows = [self._imdb_records[movie] for movie in dict.fromkeys(list_of_movies) if movie in self._imdb_records]
+        return sorted(rows, key=lambda x: x[0], reverse=True)
 
     @staticmethod
     def read_csv_column(file_path, column_name, valid_movie_ids=None):
@@ -145,25 +1195,102 @@ class Links:
         return values
 
     def __imdb_getter(self):
-        list_of_movies = self.dict_file[:10]
-        list_of_fields = ['Director', 'Budget', 'Gross worldwide', 'Gross US & Canada', 
-                          'Opening weekend US & Canada', 'Runtime', 'Title']
-        return Links.get_imdb(list_of_movies, list_of_fields)
+        return self.load_imdb_info(self.dict_file[:10])
     
     @staticmethod
-    def __Connection(imdbId):
-        url = f'https://www.imdb.com/title/tt{imdbId}/'
-        headers = { 
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Referer': 'https://www.imdb.com/title/',
-            'Upgrade-Insecure-Requests': '1'
+    def _element_end(html, start):
+        """
+        Позиция конца элемента, открывающий тег которого начинается в start,
+        или None, если теги не сбалансированы.
+        """
+        match = re.match(r'<([a-zA-Z][\w:-]*)', html[start:start + 64])
+        open_end = html.find('>', start)
+        if not match or open_end == -1:
+            return None
+        name = match.group(1).lower()
+        if name in Links.VOID_TAGS or html[open_end - 1] == '/':
+            return open_end + 1
+        depth = 0
+        for tag in re.finditer(r'<(/?)%s\b[^>]*>' % re.escape(name), html[start:], re.I):
+            if tag.group(1):
+                depth -= 1
+                if depth == 0:
+                    return start + tag.end()
+            elif not tag.group(0).endswith('/>'):
+                depth += 1
+        return None
+
+    @staticmethod
+    def _page_fragments(html):
+        """
+        Вырезает из страницы только узлы из PAGE_FRAGMENTS и элемент после
+        подписи 'IMDb RATING' в исходном порядке. None — если вырезать не удалось.
+        """
+        spans = []
+        for pattern, find_all in Links.PAGE_FRAGMENTS:
+            for match in pattern.finditer(html):
+                end = Links._element_end(html, match.start())
+                if end is None:
+                    return None
+                spans.append((match.start(), end))
+                if not find_all:
+                    break
+        label = html.find('>IMDb RATING<')
+        if label != -1:
+            value = re.compile(r'<[a-zA-Z]').search(html, label + len('>IMDb RATING'))
+            if value:
+                end = Links._element_end(html, value.start())
+                if end is None:
+                    return None
+                spans.append((label + 1, label + 1 + len('IMDb RATING')))
+                spans.append((value.start(), end))
+        parts = []
+        last_end = 0
+        for start, end in sorted(spans):
+            if start < last_end:
+                continue  # вложен в уже взятый узел
+            if html[start] == '<':
+                parts.append(html[start:end])
+            else:
+                parts.append(f'<span>{html[start:end]}</span>')
+            last_end = end
+        return "".join(parts)
+
+    @staticmethod
+    def _page_soup(html):
+        """
+        BeautifulSoup только по нужным фрагментам страницы; если фрагменты
+        вырезать не удалось — по всей странице.
+        """
+        fragments = Links._page_fragments(html)
+        return BeautifulSoup(fragments if fragments is not None else html, "html.parser")
+
+    @staticmethod
+    def benchmark_parsing(pages, repeat=3):
+        """
+        Среднее время разбора одной страницы (мс): полный html.parser против
+        _page_soup, плюс совпадают ли результаты __Make_dict/__extract_rating.
+        """
+        def run(make_soup):
+            results = []
+            started = time.perf_counter()
+            for _ in range(repeat):
+                results = []
+                for html in pages:
+                    soup = make_soup(html)
+                    results.append((Links.__Make_dict(soup), Links.__extract_rating(soup)))
+            return (time.perf_counter() - started) * 1000 / (repeat * max(1, len(pages))), results
+
+        full_ms, full = run(lambda html: BeautifulSoup(html, "html.parser"))
+        fast_ms, fast = run(Links._page_soup)
+        return {
+            "pages": len(pages),
+            "full_ms": round(full_ms, 3),
+            "fast_ms": round(fast_ms, 3),
+            "speedup": round(full_ms / fast_ms, 1) if fast_ms else 0,
+            "same_result": full == fast
         }
-        page = requests.get(url, headers=headers)
-        if page.status_code != 200:
-            raise Exception(f'Error page: {page.status_code}')
-        return page
-    
+
     @staticmethod
     def __Make_dict(soup):
         dic = {
@@ -234,28 +1361,98 @@ class Links:
             return None
 
     @staticmethod
-    def get_imdb(list_of_movies, list_of_fields):
+    def __fetch_records(list_of_movies, fetcher):
+        """
+        Записи __Make_dict по imdbId и ошибки по imdbId; ошибка одного фильма
+        не мешает остальным.
+        """
+        cache = fetcher.cache
+        records = {}
+        errors = {}
+        for id in dict.fromkeys(list_of_movies):
+            record = cache.get_record(id) if cache is not None else None
+            if record is not None:
+                records[id] = record
+        missing = [id for id in dict.fromkeys(list_of_movies) if id not in records]
+        for id, page in fetcher.fetch_many(missing).items():
+            try:
+                if isinstance(page, Exception):
+                    raise page
+                soup = Links._page_soup(page)
+                records[id] = Links.__Make_dict(soup)
+                if cache is not None:
+                    cache.put_record(id, records[id])
+            except Exception as e:
+                errors[id] = e
+        return records, errors
+
+    @staticmethod
+    def get_imdb(list_of_movies, list_of_fields, fetcher=None):
         """
         The method returns a list of lists [movieId, field1, field2, field3, ...] for the list of movies given as the argument (movieId).
             For example, [movieId, Director, Budget, Cumulative Worldwide Gross, Runtime].
             The values should be parsed from the IMDB webpages of the movies.
         Sort it by movieId descendingly.
+        Страницы скачиваются параллельно через fetcher (default_fetcher по
+        умолчанию; у объекта Links — его fetcher), разобранные записи берутся
+        из его кэша, если он задан.
         """
+        records, errors = Links.__fetch_records(list_of_movies, fetcher or default_fetcher())
+        for error in errors.values():
+            print(f"Error: {error}")
+
         imdb_info = []
-        superdict = {}
-        try:
-            for id in list_of_movies:
-                page = Links.__Connection(id)
-                soup = BeautifulSoup(page.text, "html.parser")
-                superdict = Links.__Make_dict(soup)
-                appended_list = [superdict[field] for field in list_of_fields]
-                appended_list.insert(0,id)
-                imdb_info.append(appended_list)
-        except Exception as e:
-            print(f"Error: {e}") 
+        for id, superdict in records.items():
+            appended_list = [superdict[field] for field in list_of_fields]
+            appended_list.insert(0,id)
+            imdb_info.append(appended_list)
         sorted_data = sorted(imdb_info, key=lambda x: x[0], reverse=True)
         return sorted_data
         
+    def crawl(self, checkpoint_path, list_of_movies=None, list_of_fields=None, batch_size=100):
+        """
+        Пакетный обход IMDb (по умолчанию — все imdbId из links.csv) с чекпоинтом.
+        После каждой пачки в checkpoint_path (JSON Lines) дописываются готовые
+        записи и ошибки. При повторном запуске уже готовые фильмы не скачиваются,
+        а фильмы с ошибками пробуются снова.
+        Возвращает строки [imdbId, field1, ...] как get_imdb.
+        """
+        list_of_movies = list(dict.fromkeys(self.dict_file if list_of_movies is None else list_of_movies))
+        list_of_fields = list_of_fields or Links.IMDB_FIELDS
+        done = {}
+        try:
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # недописанная строка после аварийной остановки
+                    if "record" in entry:
+                        done[entry["imdbId"]] = entry["record"]
+        except FileNotFoundError:
+            pass
+
+        pending = [movie for movie in list_of_movies if movie not in done]
+        with open(checkpoint_path, 'a', encoding='utf-8') as f:
+            for i in range(0, len(pending), batch_size):
+                records, errors = Links.__fetch_records(pending[i:i + batch_size], self.fetcher)
+                for movie, record in records.items():
+                    f.write(json.dumps({"imdbId": movie, "record": record}, ensure_ascii=False) + "\n")
+                for movie, error in errors.items():
+                    f.write(json.dumps({"imdbId": movie, "error": str(error)}, ensure_ascii=False) + "\n")
+                    print(f"Error: {error}")
+                f.flush()
+                os.fsync(f.fileno())
+                done.update(records)
+
+        imdb_info = []
+        for movie in list_of_movies:
+            if movie in done:
+                imdb_info.append([movie] + [done[movie][field] for field in list_of_fields])
+                if list_of_fields == Links.IMDB_FIELDS:
+                    self._imdb_records[movie] = imdb_info[-1]
+        return sorted(imdb_info, key=lambda x: x[0], reverse=True)
+
     def top_directors(self, n):
         """
         The method returns a dict with top-n directors where the keys are directors and 
@@ -268,7 +1465,7 @@ class Links:
             else:
                 directors[i[1]] += 1
 
-        return dict(sorted(directors.items(), key=lambda x: x[1], reverse=True)[:n])
+        return dict(top_n(directors.items(), n))
         
     def most_expensive(self, n):
         """
@@ -280,7 +1477,7 @@ class Links:
             budget = float(''.join(filter(str.isdigit, i[2]))) 
             budgets[i[7]] = budget
 
-        return dict(sorted(budgets.items(), key=lambda x: x[1], reverse=True)[:n])
+        return dict(top_n(budgets.items(), n))
         
     def most_profitable(self, n):
         """
@@ -294,7 +1491,7 @@ class Links:
             budget = float(''.join(filter(str.isdigit, i[2])))
             profits[i[7]] = gross_worldwide - budget
 
-        return dict(sorted(profits.items(), key=lambda x: x[1], reverse=True)[:n])
+        return dict(top_n(profits.items(), n))
         
     @staticmethod
     def parse_runtime(runtime_str):
@@ -347,7 +1544,7 @@ class Links:
 
             parsed.append((title, total_minutes))
 
-        top = sorted(parsed, key=lambda x: x[1], reverse=True)[:n]
+        top = top_n(parsed, n)
         return dict(top)
         
     def top_cost_per_minute(self, n):
@@ -362,20 +1559,18 @@ the values are the budgets divided by their runtime. The budgets can be in diffe
             budget = float(''.join(filter(str.isdigit, i[2])))
             costs[i[7]] = budget / mins
 
-        return dict(sorted(costs.items(), key=lambda x: x[1], reverse=True)[:n])
+        return dict(top_n(costs.items(), n))
     
 
     @staticmethod
-    def get_imdb_rating(list_of_movies):
+    def get_imdb_rating(list_of_movies, fetcher=None):
         rating_info = []
 
-        for movie_id in list_of_movies:
+        for movie_id, page in (fetcher or default_fetcher()).fetch_many(list_of_movies).items():
             try:
-
-                response = Links.__Connection(movie_id)
-                soup = BeautifulSoup(response.text, "html.parser")
-
-                #parsed_data = Links.__Make_dict(soup)
+                if isinstance(page, Exception):
+                    raise page
+                soup = Links._page_soup(page)
 
                 title_div = soup.find('title')
                 if title_div:
@@ -395,52 +1590,144 @@ the values are the budgets divided by their runtime. The budgets can be in diffe
         return rating_info
 
 
-class Movies:
-    def __init__(self, path_to_file):
-        self._path = path_to_file
-        self.movies_list = self.__load_file(max_lines=1000)
-        self.movies_dict = {m["movieId"]: m for m in self.movies_list}
+def _read_only(self, *args, **kwargs):
+    raise TypeError(f"{type(self).__name__} только для чтения")
 
-    def __load_file(self, max_lines=1000):
-        movies = []
-        try:
-            with open(self._path, 'r', encoding='utf-8') as file:
-                header = file.readline().strip()
-                if header != "movieId,title,genres":
-                    raise ValueError("Invalid file structure. Expected header: 'movieId,title,genres'")
-                for line_number, line in enumerate(file, start=1):
-                    if max_lines is not None and line_number > max_lines:
-                        break  # достигли лимит строк
 
-                    line = line.strip()
-                    if not line:
-                        continue
+class FrozenList(list):
+    """
+    Список только для чтения: общие строки MovieCatalog нельзя изменить
+    по ошибке в одном из владельцев.
+    """
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
 
-                    # Отделяем жанры с конца строки
-                    last_comma = line.rfind(',')
-                    if last_comma == -1:
-                        continue  # строка некорректна
+    def __reduce__(self):
+        return FrozenList, (list(self),)
 
-                    genres_str = line[last_comma + 1:].strip()
-                    left = line[:last_comma]
 
-                    # Теперь отделим movieId и title
-                    first_comma = left.find(',')
-                    if first_comma == -1:
-                        continue
-                    movie_id_str = left[:first_comma].strip()
+class FrozenRow(dict):
+    """
+    Строка каталога (словарь) только для чтения.
+    """
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
 
-                    title = left[first_comma + 1:].strip()
-                    if '"' in title:
-                        if title.split('"')[0] != '' or title.split('"')[-1] != '':
-                            continue
-                    else:
-                        if len(title.split(',')) != 1:
-                            continue
-                    title = title.strip('"')
+    def __reduce__(self):
+        return FrozenRow, (dict(self),)
 
-                    genres = [g.strip() for g in genres_str.split('|')] if genres_str else []
 
+class MovieCatalog:
+    """
+    Неизменяемый каталог фильмов из movies.csv. Файл разбирается один раз
+    (с учетом кавычек по RFC 4180), а каталог передается по ссылке в Movies,
+    Ratings и Tags вместе с готовыми словарями id -> название/жанры/год.
+    Строки rows общие для всех владельцев, поэтому хранятся как FrozenRow
+    с жанрами FrozenList и доступны только для чтения.
+    Жанры фильма кодируются битовой маской: бит 0 — фильм есть в каталоге,
+    остальные биты — по genre_bits.
+    Строки, переданные вызывающим кодом, приводятся к виду movies.csv:
+    без movieId или строкового title пропускаются, отсутствующие жанры —
+    пустой список, строка жанров разбивается по "|".
+    """
+    # каталоги по слабым ссылкам: живут, пока ими пользуется кто-то еще
+    _loaded = weakref.WeakValueDictionary()
+
+    def __init__(self, rows, path=None):
+        self._path = path
+        self._fingerprint = None
+        self._rows = FrozenList(
+            FrozenRow(m, genres=FrozenList(self._row_genres(m))) for m in rows
+            if m.get("movieId") is not None and isinstance(m.get("title"), str)
+        )
+        rows = self._rows
+        self._titles = MappingProxyType({m["movieId"]: m["title"] for m in rows})
+        self._genres = MappingProxyType({m["movieId"]: tuple(m["genres"]) for m in rows})
+        genre_bits = {}
+        masks = {}
+        for m in rows:
+            mask = 1
+            for genre in m["genres"]:
+                if genre not in genre_bits:
+                    genre_bits[genre] = 1 << (len(genre_bits) + 1)
+                mask |= genre_bits[genre]
+            masks[m["movieId"]] = mask
+        self._genre_bits = MappingProxyType(genre_bits)
+        self._genre_masks = MappingProxyType(masks)
+        self._row_masks = self.mask_column(m["movieId"] for m in rows)
+        years = {}
+        for m in rows:
+            year = extract_year_from_title(m["title"])
+            if year is not None:
+                years[m["movieId"]] = year
+        self._years = MappingProxyType(years)
+
+    @staticmethod
+    def _row_genres(m):
+        genres = m.get("genres", [])
+        if isinstance(genres, str):
+            return genres.split('|') if genres else []
+        return genres
+
+    @classmethod
+    def load(cls, path, max_lines=1000, use_cache=True, cache_dir=None):
+        """
+        Каталог для файла; повторные вызовы с тем же неизмененным файлом
+        возвращают тот же объект, пока он где-то используется.
+        use_cache=False всегда разбирает файл заново.
+        """
+        if not use_cache:
+            return cls(cls._read_rows(path, max_lines, use_cache), path)
+        key = (os.path.abspath(path), max_lines)
+        try:
+            fingerprint = file_fingerprint(path)
+        except OSError:
+            fingerprint = None
+        loaded = cls._loaded.get(key)
+        if fingerprint is not None and loaded is not None and loaded._fingerprint == fingerprint:
+            return loaded
+        catalog = cls(cls._read_rows(path, max_lines, use_cache, cache_dir), path)
+        if fingerprint is not None:
+            catalog._fingerprint = fingerprint
+            cls._loaded[key] = catalog
+        return catalog
+
+    @staticmethod
+    def _read_rows(path, max_lines, use_cache, cache_dir=None):
+        cache = SidecarCache(path, ("movies", max_lines), cache_dir) if use_cache else None
+        columns = cache.load() if cache else None
+        if columns is not None:
+            return [
+                {"movieId": movie_id, "title": title, "genres": genres.split('|') if genres else []}
+                for movie_id, title, genres in zip(columns["movieId"], columns["title"], columns["genres"])
+            ]
+        movies = MovieCatalog.parse(path, max_lines)
+        if cache:
+            cache.save({
+                "movieId": array('i', (m["movieId"] for m in movies)),
+                "title": [m["title"] for m in movies],
+                "genres": ['|'.join(m["genres"]) for m in movies]
+            })
+        return movies
+
+    @staticmethod
+    def parse(path, max_lines=1000):
+        movies = []
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as file:
+                reader = csv.reader(file)
+                header = next(reader, [])
+                if header != ["movieId", "title", "genres"]:
+                    raise ValueError("Invalid file structure. Expected header: 'movieId,title,genres'")
+                for line_number, row in enumerate(reader, start=1):
+                    if max_lines is not None and line_number > max_lines:
+                        break  # достигли лимит строк
+                    if len(row) != 3:
+                        continue  # пустая или некорректная строка
+                    movie_id_str, title, genres_str = (field.strip() for field in row)
+                    genres = [g.strip() for g in genres_str.split('|')] if genres_str else []
                     try:
                         movies.append({
                             "movieId": int(movie_id_str),
@@ -449,204 +1736,1226 @@ class Movies:
                         })
                     except ValueError:
                         continue
-
         except Exception as e:
             print(f"Ошибка при чтении файла Movies: {e}")
         return movies
 
-    def get_movies(self):
-        return self.movies_list
-    
-    def get_movie_id_by_title(self, title):
-        for movie in self.movies_list:
-            if movie.get("title", "").lower() == title.lower():
-                return int(movie["movieId"])
-        return None
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def rows(self):
+        return self._rows
+
+    @property
+    def titles(self):
+        return self._titles
+
+    @property
+    def genres(self):
+        return self._genres
+
+    @property
+    def years(self):
+        return self._years
+
+    @property
+    def genre_bits(self):
+        return self._genre_bits
+
+    @property
+    def genre_masks(self):
+        return self._genre_masks
+
+    @property
+    def row_masks(self):
+        """
+        Колонка масок жанров, выровненная с rows.
+        """
+        return self._row_masks
+
+    def mask_column(self, movie_ids):
+        """
+        Маски жанров для колонки movieId (0 — фильма нет в каталоге).
+        """
+        values = map(self._genre_masks.get, movie_ids, repeat(0))
+        return array('Q', values) if len(self._genre_bits) < 64 else list(values)
+
+    def genre_flags(self, masks, genres=None, match="any"):
+        """
+        Итератор флагов для последовательности масок: есть ли у фильма хотя бы
+        один (match="any") или все (match="all") жанры из genres — строки или
+        набора строк. genres=None отбирает все фильмы каталога.
+        Проверка — побитовые операции, без списков жанров.
+        """
+        if genres is None:
+            genres = ()
+        elif isinstance(genres, str):
+            genres = (genres,)
+        # неизвестному жанру отвечает бит, которого нет ни у одного фильма
+        missing = 1 << (len(self._genre_bits) + 1)
+        wanted = 0
+        for genre in genres:
+            wanted |= self._genre_bits.get(genre, missing)
+        if match == "all" or not wanted:
+            wanted |= 1
+            return map(wanted.__eq__, map(wanted.__and__, masks))
+        if match != "any":
+            raise ValueError(f"match должен быть 'any' или 'all', а не {match!r}")
+        return map(wanted.__and__, masks)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, movie_id):
+        return movie_id in self._titles
+
+
+class Movies:
+    def __init__(self, path_to_file, use_cache=True, cache_dir=None):
+        """
+        path_to_file — путь к movies.csv или уже загруженный MovieCatalog.
+        cache_dir — каталог для SidecarCache (по умолчанию рядом с файлом).
+        """
+        if isinstance(path_to_file, MovieCatalog):
+            self.catalog = path_to_file
+        else:
+            self.catalog = MovieCatalog.load(path_to_file, max_lines=1000, use_cache=use_cache, cache_dir=cache_dir)
+        self._path = self.catalog.path
+        self.movies_list = self.catalog.rows
+        self.movies_dict = {m["movieId"]: m for m in self.movies_list}
+
+    def __load_file(self, max_lines=1000):
+        return MovieCatalog.parse(self._path, max_lines)
+
+    def get_movies(self):
+        return self.movies_list
+    
+    def get_movie_id_by_title(self, title):
+        for movie in self.movies_list:
+            if movie.get("title", "").lower() == title.lower():
+                return int(movie["movieId"])
+        return None
+
+    def dist_by_release(self):
+        release_years = defaultdict(int)
+        for movie in self.movies_list:
+            title = movie.get("title")
+            if not title or not isinstance(title, str):
+                continue  # пропускаем, если нет заголовка или он не строка
+        
+            match = re.search(r"\((\d{4})\)", title)
+            if match:
+                year = match.group(1)
+                release_years[year] += 1
+        return OrderedDict(sorted(release_years.items(), key=lambda x: x[1], reverse=True))
+    
+    def dist_by_genres(self):
+        genres = Counter()
+        for movie in self.movies_list:
+            for genre in movie["genres"]:  # уже список
+                genres[genre] += 1
+        return dict(genres.most_common())
+
+    def most_genres(self, n):
+        try:
+            if n < 0:
+                raise Exception("n >= 0")
+            movies = {
+                movie["title"]: len(movie["genres"])
+                for movie in self.movies_list
+            }
+            return OrderedDict(top_n(movies.items(), n))
+        except Exception as e:
+            print(f"error: {e}")
+            return {}
+
+    def movies_by_genre(self, genre, match="any"):
+        """
+        genre — жанр или набор жанров; match="all" требует все жанры сразу.
+        """
+        flags = self.catalog.genre_flags(self.catalog.row_masks, genre, match)
+        return [movie["title"] for movie in compress(self.movies_list, flags)]
+
+    def movies_by_year(self, year):
+ 
+        movies = [
+            {"title": movie["title"], "genres": movie["genres"]} 
+            for movie in self.movies_list 
+            if f"({year})" in movie["title"]
+        ]
+        
+        if not movies:
+            return []
+
+        def dist_by_genres(movies_subset):
+            genres = Counter()
+            for movie in movies_subset:
+                for genre in movie["genres"]:
+                    genres[genre] += 1
+            return dict(genres.most_common())
+
+        genre_distribution = dist_by_genres(movies)
+        most_common_genre = next(iter(genre_distribution.items())) if genre_distribution.items() else (None,0)
+
+        def movie_popularity(genres):
+            return sum(genre_distribution.get(g, 0) for g in genres)
+
+        sorted_movies = sorted(
+            movies,
+            key=lambda x: movie_popularity(x["genres"]),
+            reverse=True
+        )
+        print(f'total movies: {len(movies)}, most popularity genre: {most_common_genre}')
+
+        return [{m["title"]: m["genres"]} for m in sorted_movies]
+
+    def common_genre_combinations(self, n=10):
+        try:
+            if n < 0:
+                raise Exception('n > 0')
+            combo_counts = Counter(
+            '|'.join(sorted(movie["genres"]))
+            for movie in self.movies_list if movie["genres"]
+            )
+            return dict(combo_counts.most_common(n))
+        except Exception as e:
+            print(f"error: {e}")
+            return {}
+    
+class RatingStore:
+    """
+    Колоночное хранилище оценок: userId, movieId, rating и timestamp
+    лежат в типизированных непрерывных массивах (модуль array), а не в списке
+    словарей. Одна оценка занимает 20 байт против ~300 байт у словаря.
+    """
+    FIELDS = ("userId", "movieId", "rating", "timestamp")
+
+    def __init__(self):
+        self.user_ids = array('i')
+        self.movie_ids = array('i')
+        self.rating_values = array('f')
+        self.timestamps = array('q')
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Хранилище поверх готовых колонок (array или memoryview из SidecarCache).
+        """
+        store = cls()
+        store.user_ids = columns["userId"]
+        store.movie_ids = columns["movieId"]
+        store.rating_values = columns["rating"]
+        store.timestamps = columns["timestamp"]
+        return store
+
+    def columns(self):
+        return dict(zip(RatingStore.FIELDS,
+                        (self.user_ids, self.movie_ids, self.rating_values, self.timestamps)))
+
+    def _make_writable(self):
+        if not isinstance(self.user_ids, array):
+            # колонки отображены из кэша только для чтения — копируем в array
+            self.user_ids = array('i', self.user_ids)
+            self.movie_ids = array('i', self.movie_ids)
+            self.rating_values = array('f', self.rating_values)
+            self.timestamps = array('q', self.timestamps)
+
+    def extend(self, user_ids, movie_ids, rating_values, timestamps):
+        self._make_writable()
+        self.user_ids.extend(user_ids)
+        self.movie_ids.extend(movie_ids)
+        self.rating_values.extend(rating_values)
+        self.timestamps.extend(timestamps)
+
+    def append(self, user_id, movie_id, rating, timestamp):
+        self._make_writable()
+        self.user_ids.append(user_id)
+        self.movie_ids.append(movie_id)
+        self.rating_values.append(rating)
+        self.timestamps.append(timestamp)
+
+    def __len__(self):
+        return len(self.rating_values)
+
+    def __getitem__(self, index):
+        return {
+            "userId": self.user_ids[index],
+            "movieId": self.movie_ids[index],
+            "rating": self.rating_values[index],
+            "timestamp": self.timestamps[index]
+        }
+
+    def __iter__(self):
+        for values in zip(self.user_ids, self.movie_ids, self.rating_values, self.timestamps):
+            yield dict(zip(RatingStore.FIELDS, values))
+
+    def nbytes(self):
+        columns = (self.user_ids, self.movie_ids, self.rating_values, self.timestamps)
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def memory_comparison(self, sample_size=1000):
+        """
+        Сравнивает занимаемую память с прежним представлением (список словарей).
+        Размер списка словарей оценивается по выборке первых sample_size строк.
+        """
+        n = len(self)
+        sample = [self[i] for i in range(min(n, sample_size))]
+        per_row = 0
+        if sample:
+            row_bytes = sum(
+                sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+                for row in sample
+            )
+            per_row = row_bytes / len(sample) + 8  # + указатель в списке
+        dicts = int(per_row * n)
+        columnar = self.nbytes()
+        return {
+            "rows": n,
+            "columnar_bytes": columnar,
+            "dict_list_bytes": dicts,
+            "ratio": round(dicts / columnar, 1) if columnar else 0
+        }
+
+
+class CsrIndex:
+    """
+    Группировка строк колонки по ключу в стиле CSR: ids — отсортированные
+    уникальные ключи, offsets — границы групп, order — номера строк,
+    сгруппированные по ключу (внутри группы в исходном порядке). Строки
+    одного ключа — срез order[offsets[i]:offsets[i + 1]].
+    size — сколько строк колонки покрыто индексом.
+    """
+    def __init__(self, keys):
+        counts = Counter(keys)
+        self.ids = array('i', sorted(counts))
+        self.offsets = array('q', [0])
+        for key in self.ids:
+            self.offsets.append(self.offsets[-1] + counts[key])
+        self.size = len(keys)
+        positions = {key: self.offsets[i] for i, key in enumerate(self.ids)}
+        order = array('q', bytes(8 * self.size))
+        for row, key in enumerate(keys):
+            order[positions[key]] = row
+            positions[key] += 1
+        self.order = order
+
+    def bounds(self, key):
+        """
+        (начало, конец) группы key в order; (0, 0), если ключа нет.
+        """
+        i = bisect_right(self.ids, key) - 1
+        if i < 0 or self.ids[i] != key:
+            return 0, 0
+        return self.offsets[i], self.offsets[i + 1]
+
+    def rows(self, key):
+        start, end = self.bounds(key)
+        return self.order[start:end]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class MovieStats:
+    """
+    Сводка оценок по фильмам, собранная за один проход: количество, сумма,
+    сумма квадратов и RatingHistogram для каждого movieId. Запросы top-n по
+    ней стоят O(фильмов), а не O(оценок). Сводки складываются по пачкам
+    (update), поэтому строятся и по потоку. При quantiles="sketch" квантили
+    считаются по KllSketch (для значений вне сетки полузвезд и потоковой
+    загрузки).
+    """
+    def __init__(self, movie_ids, rating_values, quantiles="exact", k=200):
+        self.counts = {}
+        self.sums = {}
+        self.sums_sq = {}
+        self.histograms = {}
+        self.sketches = {} if quantiles == "sketch" else None
+        self._new_sketch = quantile_counter(quantiles, k)
+        self.update(movie_ids, rating_values)
+
+    @classmethod
+    def from_chunks(cls, chunks, quantiles="sketch", k=200):
+        """
+        Сводка по потоку пачек read_csv_chunks без хранения всех оценок.
+        """
+        stats = cls((), (), quantiles, k)
+        for chunk in chunks:
+            stats.update(*chunk_columns(chunk, "movieId"))
+        return stats
+
+    def update(self, movie_ids, rating_values):
+        """
+        Добавляет пачку оценок в сводку.
+        """
+        for mid, rating in zip(movie_ids, rating_values):
+            if mid in self.counts:
+                self.counts[mid] += 1
+                self.sums[mid] += rating
+                self.sums_sq[mid] += rating * rating
+            else:
+                self.counts[mid] = 1
+                self.sums[mid] = rating
+                self.sums_sq[mid] = rating * rating
+                self.histograms[mid] = RatingHistogram()
+                if self.sketches is not None:
+                    self.sketches[mid] = self._new_sketch()
+            self.histograms[mid].add(rating)
+            if self.sketches is not None:
+                self.sketches[mid].add(rating)
+
+    def mean(self, mid):
+        return self.sums[mid] / self.counts[mid]
+
+    def median(self, mid):
+        return self.quantile(mid, 0.5)
+
+    def quantile(self, mid, q):
+        distributions = self.histograms if self.sketches is None else self.sketches
+        return distributions[mid].quantile(q)
+
+    def variance(self, mid):
+        return sums_variance(self.counts[mid], self.sums[mid], self.sums_sq[mid])
+
+
+def by_column(item):
+    return item[0]
+
+
+_worker_similarity = None
+
+def _init_similarity_worker(state):
+    global _worker_similarity
+    _worker_similarity = state
+
+def _similarity_block(task):
+    return _item_neighbours(_worker_similarity, *task)
+
+def _item_neighbours(state, start, end):
+    """
+    Top-k соседей для столбцов (фильмов) start..end-1: скалярные произведения
+    копятся только по пользователям, оценившим фильм (строка X^T X), поэтому
+    память ограничена одним блоком фильмов. inv_norms — 1/норма столбца
+    (0 для нулевого столбца, у него нет соседей).
+    """
+    user_indptr, user_cols, user_vals, item_indptr, item_rows, item_vals, inv_norms, k, min_common = state
+    zero = [j for j, inv in enumerate(inv_norms) if not inv]
+    result = []
+    for i in range(start, end):
+        inv_norm = inv_norms[i]
+        if not inv_norm:
+            result.append([])
+            continue
+        dots = {}
+        get = dots.get
+        common = Counter() if min_common > 1 else None
+        for p in range(item_indptr[i], item_indptr[i + 1]):
+            u, value = item_rows[p], item_vals[p]
+            a, b = user_indptr[u], user_indptr[u + 1]
+            columns = user_cols[a:b]
+            # срезы и zip дешевле поэлементной индексации массивов
+            for j, v in zip(columns, user_vals[a:b]):
+                dots[j] = get(j, 0.0) + value * v
+            if common is not None:
+                common.update(columns)
+        dots.pop(i, None)
+        for j in zero:
+            dots.pop(j, None)
+        if common is not None:
+            for j, count in common.items():
+                if count < min_common:
+                    dots.pop(j, None)
+        # кортежи (dot/норма j, -j) сравниваются без Python-ключа: по убыванию
+        # сходства, при равенстве — меньший номер столбца
+        columns = dots.keys()
+        top = heapq.nlargest(k, zip(map(mul, dots.values(), map(inv_norms.__getitem__, columns)), map(neg, columns)))
+        result.append([(-j, score * inv_norm) for score, j in top])
+    return result
+
+
+class RatingMatrix:
+    """
+    Разреженная матрица пользователь x фильм в формате CSR: строки —
+    пользователи, столбцы — фильмы, оба перенумерованы плотно по
+    возрастанию id (user_ids/movie_ids — обратные отображения,
+    user_pos/movie_pos — прямые). indptr, indices и data — типизированные
+    массивы, которые отдаются в scipy без копирования. Если пользователь
+    оценил фильм несколько раз, в ячейке остается последняя оценка.
+    """
+    def __init__(self, store, user_index):
+        self.user_ids = user_index.ids
+        self.movie_ids = array('i', sorted(set(store.movie_ids)))
+        self.user_pos = {uid: i for i, uid in enumerate(self.user_ids)}
+        self.movie_pos = {mid: i for i, mid in enumerate(self.movie_ids)}
+        # scipy требует одинаковый тип indptr и indices
+        typecode = 'i' if len(store) < 2 ** 31 else 'q'
+        self.indptr = array(typecode, [0])
+        self.indices = array(typecode)
+        self.data = array('f')
+        order, offsets = user_index.order, user_index.offsets
+        for i in range(len(self.user_ids)):
+            # dict оставляет последнюю оценку для повторной пары пользователь-фильм
+            row = sorted({
+                self.movie_pos[store.movie_ids[r]]: store.rating_values[r] for r in order[offsets[i]:offsets[i + 1]]
+            }.items(), key=by_column)
+            self.indices.extend(col for col, _ in row)
+            self.data.extend(rating for _, rating in row)
+            self.indptr.append(len(self.indices))
+
+    @property
+    def shape(self):
+        return len(self.user_ids), len(self.movie_ids)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def user_row(self, user_id):
+        """
+        {movieId: оценка} пользователя; пустой словарь для неизвестного userId.
+        """
+        i = self.user_pos.get(user_id)
+        if i is None:
+            return {}
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return {self.movie_ids[col]: rating for col, rating in zip(self.indices[start:end], self.data[start:end])}
+
+    def to_scipy(self):
+        """
+        scipy.sparse.csr_matrix поверх тех же буферов (без копирования данных).
+        """
+        try:
+            import numpy as np
+            from scipy.sparse import csr_matrix
+        except ImportError as e:
+            raise ImportError("Для to_scipy нужны numpy и scipy") from e
+        return csr_matrix(
+            (np.frombuffer(self.data, dtype=np.float32),
+             np.frombuffer(self.indices, dtype=np.dtype(self.indices.typecode)),
+             np.frombuffer(self.indptr, dtype=np.dtype(self.indptr.typecode))),
+            shape=self.shape, copy=False
+        )
+
+
+class ItemSimilarity:
+    """
+    Предрассчитанные top-k соседи каждого фильма по косинусному
+    (method="cosine") или скорректированному косинусному сходству
+    ("adjusted_cosine" — из оценок вычитается среднее пользователя).
+    Соседи хранятся в CSR-виде: movie_ids, offsets, neighbours (movieId)
+    и scores, поэтому запрос similar — срез.
+    """
+    METHODS = ("cosine", "adjusted_cosine")
+
+    def __init__(self, movie_ids, offsets, neighbours, scores):
+        self.movie_ids = movie_ids
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.scores = scores
+        self.movie_pos = {mid: i for i, mid in enumerate(movie_ids)}
+
+    @classmethod
+    def build(cls, ratings, method="cosine", k=20, min_common=1, block_size=256, workers=None):
+        """
+        Считает соседей по ratings.rating_matrix блоками по block_size фильмов
+        в workers процессах (по умолчанию — по числу ядер; workers=1 — в
+        текущем процессе). Работа пропорциональна числу пар оценок одного
+        пользователя, sum(n_u ** 2): 0.25-0.4 мкс на пару на ядро. Для
+        ml-latest-small это ~10^7 пар (секунды), для ml-25m — ~10^10 пар,
+        то есть около часа на одно ядро и минуты на 8-16 ядрах; оценку
+        для своих данных дает ItemSimilarity.benchmark.
+        """
+        matrix, state = cls._prepare(ratings, method, k, min_common)
+        n_items = matrix.shape[1]
+        tasks = [(start, min(start + block_size, n_items)) for start in range(0, n_items, block_size)]
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_similarity_worker,
+                                     initargs=(state,)) as pool:
+                blocks = list(pool.map(_similarity_block, tasks))
+        else:
+            blocks = [_item_neighbours(state, start, end) for start, end in tasks]
+
+        offsets = array('q', [0])
+        neighbours = array('i')
+        scores = array('f')
+        for block in blocks:
+            for top in block:
+                neighbours.extend(matrix.movie_ids[j] for j, _ in top)
+                scores.extend(score for _, score in top)
+                offsets.append(len(neighbours))
+        return cls(array('i', matrix.movie_ids), offsets, neighbours, scores)
+
+    @classmethod
+    def benchmark(cls, ratings, method="cosine", k=20, min_common=1, sample=256, workers=None):
+        """
+        Время одного ядра на sample фильмов, пересчитанное на все фильмы:
+        число пар sum(n_u ** 2), мкс на пару и ожидаемые секунды build при
+        workers процессах.
+        """
+        matrix, state = cls._prepare(ratings, method, k, min_common)
+        user_indptr, item_indptr, item_rows = state[0], state[3], state[4]
+        sizes = [user_indptr[u + 1] - user_indptr[u] for u in range(matrix.shape[0])]
+        pairs = sum(n * n for n in sizes)
+        sample = min(sample, matrix.shape[1])
+        sample_pairs = sum(sizes[u] for u in item_rows[:item_indptr[sample]])
+        started = time.perf_counter()
+        _item_neighbours(state, 0, sample)
+        elapsed = time.perf_counter() - started
+        per_pair = elapsed / sample_pairs if sample_pairs else 0.0
+        workers = workers or os.cpu_count() or 1
+        return {
+            "pairs": pairs,
+            "us_per_pair": round(per_pair * 1e6, 3),
+            "workers": workers,
+            "estimated_s": round(per_pair * pairs / workers, 1)
+        }
+
+    @classmethod
+    def _prepare(cls, ratings, method, k, min_common):
+        """
+        Матрица оценок и состояние для _item_neighbours: строки (CSR) и
+        столбцы (CSC) с центрированными для adjusted_cosine оценками и
+        обратные нормы столбцов.
+        """
+        if method not in cls.METHODS:
+            raise ValueError(f"method должен быть одним из {cls.METHODS}, а не {method!r}")
+        matrix = ratings.rating_matrix
+        n_users, n_items = matrix.shape
+        user_vals = array('d', matrix.data)
+        if method == "adjusted_cosine":
+            # среднее по той же строке матрицы, что и в сходстве: повторные
+            # оценки фильма и оценки вне каталога в него не входят
+            for u in range(n_users):
+                start, end = matrix.indptr[u], matrix.indptr[u + 1]
+                if start == end:
+                    continue
+                user_mean = sum(user_vals[start:end]) / (end - start)
+                for p in range(start, end):
+                    user_vals[p] -= user_mean
+
+        # транспонированная копия (CSC): пользователи каждого фильма
+        counts = array('q', bytes(8 * (n_items + 1)))
+        for col in matrix.indices:
+            counts[col + 1] += 1
+        item_indptr = array('q', [0])
+        for i in range(n_items):
+            item_indptr.append(item_indptr[-1] + counts[i + 1])
+        positions = array('q', item_indptr[:-1])
+        item_rows = array('i', bytes(4 * len(user_vals)))
+        item_vals = array('d', bytes(8 * len(user_vals)))
+        for u in range(n_users):
+            for p in range(matrix.indptr[u], matrix.indptr[u + 1]):
+                col = matrix.indices[p]
+                item_rows[positions[col]] = u
+                item_vals[positions[col]] = user_vals[p]
+                positions[col] += 1
+        inv_norms = array('d')
+        for i in range(n_items):
+            norm = sum(v * v for v in item_vals[item_indptr[i]:item_indptr[i + 1]]) ** 0.5
+            inv_norms.append(1 / norm if norm else 0.0)
+
+        state = (array('q', matrix.indptr), array('i', matrix.indices), user_vals,
+                 item_indptr, item_rows, item_vals, inv_norms, k, min_common)
+        return matrix, state
+
+    @classmethod
+    def from_columns(cls, columns):
+        return cls(columns["movieId"], columns["offsets"], columns["neighbours"], columns["scores"])
+
+    def columns(self):
+        return {"movieId": self.movie_ids, "offsets": self.offsets,
+                "neighbours": self.neighbours, "scores": self.scores}
+
+    def similar(self, movie_id, n=None):
+        """
+        [(movieId, сходство), ...] по убыванию сходства; пустой список для
+        фильма без оценок.
+        """
+        i = self.movie_pos.get(movie_id)
+        if i is None:
+            return []
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if n is not None:
+            end = min(end, start + n)
+        return list(zip(self.neighbours[start:end], self.scores[start:end]))
+
 
-    def dist_by_release(self):
-        release_years = defaultdict(int)
-        for movie in self.movies_list:
-            title = movie.get("title")
-            if not title or not isinstance(title, str):
-                continue  # пропускаем, если нет заголовка или он не строка
-        
-            match = re.search(r"\((\d{4})\)", title)
-            if match:
-                year = match.group(1)
-                release_years[year] += 1
-        return OrderedDict(sorted(release_years.items(), key=lambda x: x[1], reverse=True))
-    
-    def dist_by_genres(self):
-        genres = Counter()
-        for movie in self.movies_list:
-            for genre in movie["genres"]:  # уже список
-                genres[genre] += 1
-        return dict(genres.most_common())
+class UserStats:
+    """
+    Сводка по пользователям, собранная по группам CsrIndex: RunningStats
+    (количество, среднее, дисперсия) и RatingHistogram для каждого userId.
+    Оценки пользователя добавляются в порядке файла, поэтому результаты
+    совпадают с подсчетом по спискам. При quantiles="sketch" квантили
+    считаются по KllSketch, как в MovieStats.
+    """
+    def __init__(self, index=None, rating_values=(), quantiles="exact", k=200):
+        self.stats = {}
+        self.histograms = {}
+        self.sketches = {} if quantiles == "sketch" else None
+        self._new_sketch = quantile_counter(quantiles, k)
+        if index is None:
+            return
+        order, offsets = index.order, index.offsets
+        for i, uid in enumerate(index.ids):
+            values = [rating_values[row] for row in order[offsets[i]:offsets[i + 1]]]
+            self.stats[uid] = RunningStats(values)
+            self.histograms[uid] = RatingHistogram(values)
+            if self.sketches is not None:
+                self.sketches[uid] = self._new_sketch()
+                for rating in values:
+                    self.sketches[uid].add(rating)
+
+    @classmethod
+    def from_chunks(cls, chunks, quantiles="sketch", k=200):
+        """
+        Сводка по потоку пачек read_csv_chunks без хранения всех оценок.
+        """
+        stats = cls(quantiles=quantiles, k=k)
+        for chunk in chunks:
+            stats.update(*chunk_columns(chunk, "userId"))
+        return stats
 
-    def most_genres(self, n):
-        try:
-            if n < 0:
-                raise Exception("n >= 0")
-            movies = {
-                movie["title"]: len(movie["genres"])
-                for movie in self.movies_list
-            }
-            return OrderedDict(sorted(movies.items(), key=lambda x: x[1], reverse=True)[:n])
-        except Exception as e:
-            print(f"error: {e}")
-            return {}
+    def quantile(self, uid, q):
+        distributions = self.histograms if self.sketches is None else self.sketches
+        return distributions[uid].quantile(q)
 
-    def movies_by_genre(self, genre):
-        return [movie["title"] for movie in self.movies_list if genre in movie["genres"]]
+    def update(self, user_ids, rating_values):
+        """
+        Добавляет новые оценки в сводку.
+        """
+        for uid, rating in zip(user_ids, rating_values):
+            if uid not in self.stats:
+                self.stats[uid] = RunningStats()
+                self.histograms[uid] = RatingHistogram()
+                if self.sketches is not None:
+                    self.sketches[uid] = self._new_sketch()
+            self.stats[uid].add(rating)
+            self.histograms[uid].add(rating)
+            if self.sketches is not None:
+                self.sketches[uid].add(rating)
+
+
+class RatingTimeSeries:
+    """
+    Оценки по периодам (день, неделя или месяц): для каждого периода
+    количество и сумма оценок, всего (totals) и по фильмам (movies).
+    Новые оценки меняют только свои периоды (update), а скользящие окна
+    и тренды считаются по периодам, без прохода по оценкам.
+    """
+    def __init__(self, period, keys, movie_ids, rating_values):
+        self.period = period
+        self.totals = {}
+        self.movies = {}
+        self.update(keys, movie_ids, rating_values)
 
-    def movies_by_year(self, year):
- 
-        movies = [
-            {"title": movie["title"], "genres": movie["genres"]} 
-            for movie in self.movies_list 
-            if f"({year})" in movie["title"]
-        ]
-        
-        if not movies:
+    def update(self, keys, movie_ids, rating_values):
+        """
+        Добавляет оценки; keys — колонка period_columns для них.
+        """
+        for key, mid, rating in zip(keys, movie_ids, rating_values):
+            total = self.totals.get(key)
+            if total is None:
+                total = self.totals[key] = [0, 0]
+                self.movies[key] = {}
+            total[0] += 1
+            total[1] += rating
+            cell = self.movies[key].get(mid)
+            if cell is None:
+                cell = self.movies[key][mid] = [0, 0]
+            cell[0] += 1
+            cell[1] += rating
+
+    def periods(self, start=None, end=None):
+        """
+        Начала периодов (date) подряд от start до end, включая пустые; по
+        умолчанию от первой до последней оценки.
+        """
+        if not self.totals:
             return []
+        start = period_start(start, self.period) if start else date.fromordinal(min(self.totals))
+        end = end or date.fromordinal(max(self.totals))
+        result = []
+        while start <= end:
+            result.append(start)
+            start = next_period(start, self.period)
+        return result
+
+    def rolling(self, window=7, movie_id=None, start=None, end=None):
+        """
+        Окно из window периодов, заканчивающееся в каждом периоде от start до
+        end, по всем оценкам или по movie_id: {начало периода: (количество, сумма)}.
+        """
+        if window < 1:
+            raise ValueError("window должен быть положительным")
+        periods = self.periods(start, end)
+        if not periods:
+            return {}
+        first = periods[0]
+        for _ in range(window - 1):
+            first = period_start(first - timedelta(days=1), self.period)
+        cells = []
+        for p in self.periods(first, periods[-1]):
+            key = p.toordinal()
+            if movie_id is None:
+                cells.append(self.totals.get(key, (0, 0)))
+            else:
+                cells.append(self.movies.get(key, {}).get(movie_id, (0, 0)))
+        result = {}
+        count = total = 0
+        for i, (c, s) in enumerate(cells):
+            count += c
+            total += s
+            if i >= window:
+                count -= cells[i - window][0]
+                total -= cells[i - window][1]
+            if i >= window - 1:
+                result[periods[i - window + 1]] = (count, total)
+        return result
+
+    def trending(self, n, window=7, end=None):
+        """
+        n фильмов с наибольшим числом оценок за window периодов,
+        заканчивающихся в end (по умолчанию — последний период с оценками).
+        """
+        periods = self.periods(end=end)[-window:]
+        counts = Counter()
+        for p in periods:
+            for mid, (count, _) in self.movies.get(p.toordinal(), {}).items():
+                counts[mid] += count
+        return top_n(counts.items(), n)
 
-        def dist_by_genres(movies_subset):
-            genres = Counter()
-            for movie in movies_subset:
-                for genre in movie["genres"]:
-                    genres[genre] += 1
-            return dict(genres.most_common())
 
-        genre_distribution = dist_by_genres(movies)
-        most_common_genre = next(iter(genre_distribution.items())) if genre_distribution.items() else (None,0)
+class RatingCube:
+    """
+    Предагрегированный куб оценок по (жанр, год выхода, год оценки): в каждой
+    ячейке количество, сумма и множество пользователей (set или HyperLogLog
+    при distinct="approx"). Ячейки с жанром None
+    хранят итог по всем фильмам каталога — фильм с несколькими жанрами
+    попадает в каждую свою жанровую ячейку, поэтому жанры нельзя просто
+    сложить. Строится одним проходом по оценкам.
+    """
+    DIMENSIONS = ("genre", "release_year", "rating_year")
 
-        def movie_popularity(genres):
-            return sum(genre_distribution.get(g, 0) for g in genres)
+    def __init__(self, catalog, movie_ids, user_ids, rating_values, rating_years, distinct="exact", error=0.01):
+        self.catalog = catalog
+        self.distinct = distinct
+        self._new_users = distinct_counter(distinct, error)
+        self.cells = {}
+        self._movie_keys = {}
+        self.update(movie_ids, user_ids, rating_values, rating_years)
 
-        sorted_movies = sorted(
-            movies,
-            key=lambda x: movie_popularity(x["genres"]),
-            reverse=True
-        )
-        print(f'total movies: {len(movies)}, most popularity genre: {most_common_genre}')
+    def update(self, movie_ids, user_ids, rating_values, rating_years):
+        """
+        Добавляет новые оценки в ячейки куба.
+        """
+        catalog = self.catalog
+        movie_keys = self._movie_keys
+        for mid, uid, rating, rating_year in zip(movie_ids, user_ids, rating_values, rating_years):
+            keys = movie_keys.get(mid)
+            if keys is None:
+                genres = catalog.genres.get(mid)
+                release_year = catalog.years.get(mid)
+                keys = movie_keys[mid] = [] if genres is None else [(genre, release_year) for genre in (None,) + genres]
+            for genre, release_year in keys:
+                cell = self.cells.get((genre, release_year, rating_year))
+                if cell is None:
+                    cell = self.cells[(genre, release_year, rating_year)] = [0, 0, self._new_users()]
+                cell[0] += 1
+                cell[1] += rating
+                cell[2].add(uid)
+
+    def rollup(self, by=("rating_year",), genre=None, release_year=None, rating_year=None):
+        """
+        Сворачивает куб до измерений by (подмножество DIMENSIONS) с фильтрами
+        genre/release_year/rating_year (None — без фильтра).
+        Возвращает {ключ: {"count", "sum", "users"}}; ключ — значение измерения
+        для одного измерения в by или кортеж для нескольких.
+        """
+        if isinstance(by, str):
+            by = (by,)
+        positions = [RatingCube.DIMENSIONS.index(dimension) for dimension in by]
+        by_genre = "genre" in by
+        result = {}
+        for key, (count, total, users) in self.cells.items():
+            cell_genre, cell_release, cell_year = key
+            if genre is not None:
+                if cell_genre != genre:
+                    continue
+            elif (cell_genre is None) == by_genre:
+                continue
+            if release_year is not None and cell_release != release_year:
+                continue
+            if rating_year is not None and cell_year != rating_year:
+                continue
+            group = key[positions[0]] if len(positions) == 1 else tuple(key[p] for p in positions)
+            entry = result.get(group)
+            if entry is None:
+                result[group] = {"count": count, "sum": total, "users": users.copy()}
+            else:
+                entry["count"] += count
+                entry["sum"] += total
+                entry["users"] |= users
+        return result
 
-        return [{m["title"]: m["genres"]} for m in sorted_movies]
 
-    def common_genre_combinations(self, n=10):
-        try:
-            if n < 0:
-                raise Exception('n > 0')
-            combo_counts = Counter(
-            '|'.join(sorted(movie["genres"]))
-            for movie in self.movies_list if movie["genres"]
-            )
-            return dict(combo_counts.most_common(n))
-        except Exception as e:
-            print(f"error: {e}")
-            return {}
-    
 class Ratings:
-    def __init__(self, path_to_the_file, movies_file, movie_ids):
+    def __init__(self, path_to_the_file, movies_file, movie_ids, count_lines=1000, chunk_size=10000,
+                 use_cache=True, workers=1, tz=timezone.utc, quantiles="exact", sketch_k=200, cache_dir=None,
+                 streaming=False):
+        """
+        movies_file — путь к movies.csv или общий MovieCatalog.
+        tz — часовой пояс, в котором считаются год и месяц оценки.
+        quantiles="sketch" считает медианы и перцентили групп по KllSketch(sketch_k)
+        вместо точных гистограмм.
+        count_lines — сколько оценок прочитать; None читает файл целиком
+        пачками по chunk_size строк, а при workers > 1 — параллельно
+        (read_columns_parallel). При use_cache разобранные колонки
+        сохраняются в SidecarCache (в cache_dir или рядом с файлом) и при
+        следующей загрузке отображаются в память.
+        Новые оценки добавляются через append и append_file без перезагрузки.
+        streaming=True не хранит оценки: за один проход по пачкам строятся
+        только movie_stats и user_stats (вместе с quantiles="sketch" память
+        O(фильмов + пользователей) при любом числе оценок). Доступны запросы
+        по этим сводкам (top_by_num_of_ratings, top_by_ratings,
+        top_controversial, dist_by_rating, dist_by_user_rating,
+        dist_by_num_of_ratings) и append; остальные бросают ValueError.
+        """
         self._path = path_to_the_file
-        self._movies_path = movies_file
-        self.ratings = []
-        self.movie_titles = {}
-        self.movies = []
+        self._movie_ids = movie_ids
+        self._cache_key = ("ratings", count_lines, ids_digest(movie_ids))
+        self._use_cache = use_cache
+        self._cache_dir = cache_dir
+        try:
+            # файл целиком читается только до размера на момент загрузки: строки,
+            # дописанные во время чтения, дочитает append_file с этого смещения
+            self._offset = os.path.getsize(path_to_the_file) if count_lines is None else None
+        except OSError:
+            self._offset = None
+        if isinstance(movies_file, MovieCatalog):
+            self.catalog = movies_file
+        else:
+            self.catalog = MovieCatalog.load(movies_file, max_lines=1000, use_cache=use_cache, cache_dir=cache_dir)
+        self._movies_path = self.catalog.path
+        self.movie_titles = self.catalog.titles
+        self.movies = self.catalog.rows
+        self.tz = tz
+        self.quantiles = quantiles
+        self.sketch_k = sketch_k
+        self._movie_stats = None
+        self._year_month = None
+        self._genre_masks = None
+        self._movie_index = None
+        self._user_index = None
+        self._user_stats = None
+        self._matrix = None
+        self._similarity = {}
+        self._time_series = {}
+        self.cube = None
 
         # Загружаем рейтинги
-        ratings_data = read_csv_as_dict(self._path, count_lines=1000, valid_movie_ids=movie_ids)
-        for row in ratings_data:
+        cache = SidecarCache(self._path, self._cache_key, cache_dir) if use_cache and not streaming else None
+        columns = cache.load() if cache else None
+        if columns is not None and "offset" in columns:
+            self._offset = columns.pop("offset")[0]
+        if columns is None and count_lines is None and workers > 1 and not streaming:
             try:
-                self.ratings.append({
-                    "userId": int(row.get("userId", 0)),
-                    "movieId": int(row.get("movieId", 0)),
-                    "rating": float(row.get("rating", 0.0)),
-                    "timestamp": int(row.get("timestamp", 0))
-                })
+                columns = read_columns_parallel(self._path, workers=workers, valid_movie_ids=movie_ids,
+                                                end=self._offset)
             except Exception as e:
                 print(f"Ошибка при чтении файла: {e}")
+                columns = {"userId": array('i'), "movieId": array('i'),
+                           "rating": array('f'), "timestamp": array('q')}
+            if cache:
+                cache.save(with_offset(columns, self._offset))
+        if columns is not None:
+            self.ratings = RatingStore.from_columns(columns)
+        elif streaming:
+            # строки не хранятся: каждая пачка сразу уходит в сводки
+            self.ratings = None
+            self._movie_stats = MovieStats((), (), quantiles, sketch_k)
+            self._user_stats = UserStats(quantiles=quantiles, k=sketch_k)
+            chunks = read_csv_chunks(self._path, chunk_size=chunk_size, count_lines=count_lines,
+                                     valid_movie_ids=movie_ids, end=self._offset)
+            for chunk in chunks:
+                user_ids, chunk_movie_ids, rating_values = chunk_columns(chunk, "userId", "movieId")
+                self._movie_stats.update(chunk_movie_ids, rating_values)
+                self._user_stats.update(user_ids, rating_values)
+        else:
+            self.ratings = RatingStore()
+            chunks = read_csv_chunks(self._path, chunk_size=chunk_size, count_lines=count_lines,
+                                     valid_movie_ids=movie_ids, end=self._offset)
+            for chunk in chunks:
+                for row in chunk:
+                    try:
+                        self.ratings.append(
+                            int(row.get("userId", 0)),
+                            int(row.get("movieId", 0)),
+                            float(row.get("rating", 0.0)),
+                            int(row.get("timestamp", 0))
+                        )
+                    except Exception as e:
+                        print(f"Ошибка при чтении файла: {e}")
+            if cache:
+                cache.save(with_offset(self.ratings.columns(), self._offset))
+        self._loaded_rows = len(self.ratings) if self.ratings is not None else 0
+
+    def _require_rows(self):
+        if self.ratings is None:
+            raise ValueError("Оценки не хранятся (streaming=True): доступны только запросы по movie_stats и user_stats")
+
+    @property
+    def rating_genre_masks(self):
+        """
+        Колонка масок жанров (MovieCatalog.genre_masks), выровненная с self.ratings.
+        """
+        self._require_rows()
+        if self._genre_masks is None:
+            self._genre_masks = self.catalog.mask_column(self.ratings.movie_ids)
+        return self._genre_masks
 
-        movies_data = self.__load_file(max_lines=1000)
-        for row in movies_data:
+    def append(self, rows):
+        """
+        Добавляет оценки (словари с ключами userId, movieId, rating, timestamp)
+        и обновляет на месте уже построенные производные данные: MovieStats,
+        колонки годов/месяцев и масок жанров, куб. Стоимость пропорциональна
+        числу новых строк. Возвращает число добавленных оценок.
+        """
+        delta = RatingStore()
+        for row in rows:
             try:
                 movie_id = int(row.get("movieId", 0))
-            except ValueError:
-                continue
-            if not movie_id:
-                continue
-            row["movieId"] = movie_id
-            row["title"] = row.get("title", "")
-            row["genres"] = row.get("genres", [])
-            self.movie_titles[movie_id] = row["title"]
-            self.movies.append(row)
+                if self._movie_ids is not None and movie_id not in self._movie_ids:
+                    continue
+                delta.append(
+                    int(row.get("userId", 0)),
+                    movie_id,
+                    float(row.get("rating", 0.0)),
+                    int(row.get("timestamp", 0))
+                )
+            except Exception as e:
+                print(f"Ошибка при чтении строки: {row}, ошибка: {e}")
+        if not len(delta):
+            return 0
+        if self.ratings is None:
+            self._movie_stats.update(delta.movie_ids, delta.rating_values)
+            self._user_stats.update(delta.user_ids, delta.rating_values)
+            return len(delta)
+        self.ratings.extend(delta.user_ids, delta.movie_ids, delta.rating_values, delta.timestamps)
+        if self._movie_stats is not None:
+            self._movie_stats.update(delta.movie_ids, delta.rating_values)
+        delta_years = None
+        if self._year_month is not None:
+            delta_years, delta_months = year_month_columns(delta.timestamps, self.tz)
+            self._year_month[0].extend(delta_years)
+            self._year_month[1].extend(delta_months)
+        if self._genre_masks is not None:
+            self._genre_masks.extend(self.catalog.mask_column(delta.movie_ids))
+        if self._movie_index is not None and len(self.ratings) - self._movie_index.size > self._movie_index.size // 4:
+            # новые строки ищутся линейно до следующей перестройки индекса
+            self._movie_index = None
+        if self._user_index is not None and len(self.ratings) - self._user_index.size > self._user_index.size // 4:
+            self._user_index = None
+        if self._user_stats is not None:
+            self._user_stats.update(delta.user_ids, delta.rating_values)
+        for period, series in self._time_series.items():
+            series.update(period_columns(delta.timestamps, period, self.tz), delta.movie_ids, delta.rating_values)
+        self._matrix = None
+        self._similarity = {}
+        if self.cube is not None:
+            if delta_years is None:
+                delta_years = year_month_columns(delta.timestamps, self.tz)[0]
+            self.cube.update(delta.movie_ids, delta.user_ids, delta.rating_values, delta_years)
+        return len(delta)
+
+    def append_file(self, path=None):
+        """
+        Добавляет оценки из CSV: path=None дочитывает строки, дописанные в
+        исходный ratings.csv после загрузки (только если он читался целиком,
+        count_lines=None); иначе читается отдельный файл с заголовком.
+        Смещение сдвигается ровно на прочитанные полные строки. Если исходный
+        файл стал короче (перезаписан), бросает ValueError.
+        Возвращает число добавленных оценок.
+        """
+        if path is not None:
+            return self.append(read_csv_tail(path, 0)[0])
+        if self._offset is None:
+            print("Ошибка: дочитывать можно только файл, загруженный целиком (count_lines=None)")
+            return 0
+        rows, self._offset = read_csv_tail(self._path, self._offset)
+        return self.append(rows)
 
-    def __load_file(self, max_lines=1000):
-        movies = []
-        try:
-            with open(self._movies_path, 'r', encoding='utf-8') as file:
-                header = file.readline().strip()
-                if header != "movieId,title,genres":
-                    raise ValueError("Invalid file structure. Expected header: 'movieId,title,genres'")
-                for line_number, line in enumerate(file, start=1):
-                    if max_lines is not None and line_number > max_lines:
-                        break  # достигли лимит строк
+    def time_series(self, period="day"):
+        """
+        RatingTimeSeries по периодам period ("day", "week" или "month") в self.tz;
+        строится при первом обращении и обновляется в append.
+        """
+        self._require_rows()
+        if period not in self._time_series:
+            keys = period_columns(self.ratings.timestamps, period, self.tz)
+            self._time_series[period] = RatingTimeSeries(period, keys, self.ratings.movie_ids,
+                                                         self.ratings.rating_values)
+        return self._time_series[period]
+
+    def build_cube(self, distinct="exact", error=0.01):
+        """
+        Строит RatingCube; после этого запросы по одному жанру и году выхода
+        в Ratings.Movies и Ratings.Users отвечают из куба без прохода по оценкам.
+        distinct="approx" хранит пользователей ячеек в HyperLogLog с ошибкой error.
+        """
+        self._require_rows()
+        self.cube = RatingCube(self.catalog, self.ratings.movie_ids, self.ratings.user_ids,
+                               self.ratings.rating_values, self.rating_years, distinct, error)
+        return self.cube
 
-                    line = line.strip()
-                    if not line:
-                        continue
+    def cube_for(self, catalog, genre_filter, match):
+        """
+        Куб, если он построен и запрос ему по силам (один жанр или без фильтра
+        по общему каталогу), иначе None.
+        """
+        if self.cube is None or catalog is not self.catalog:
+            return None
+        if genre_filter is None or isinstance(genre_filter, str):
+            return self.cube
+        return None
 
-                    # Отделяем жанры с конца строки
-                    last_comma = line.rfind(',')
-                    if last_comma == -1:
-                        continue  # строка некорректна
+    def genre_masks_for(self, catalog):
+        self._require_rows()
+        if catalog is self.catalog:
+            return self.rating_genre_masks
+        return catalog.mask_column(self.ratings.movie_ids)
 
-                    genres_str = line[last_comma + 1:].strip()
-                    left = line[:last_comma]
+    @property
+    def rating_years(self):
+        """
+        Колонка годов оценок (в self.tz), выровненная с self.ratings.
+        """
+        return self.__year_month()[0]
 
-                    # Теперь отделим movieId и title
-                    first_comma = left.find(',')
-                    if first_comma == -1:
-                        continue
-                    movie_id_str = left[:first_comma].strip()
+    @property
+    def rating_months(self):
+        return self.__year_month()[1]
 
-                    title = left[first_comma + 1:].strip()
-                    if '"' in title:
-                        if title.split('"')[0] != '' or title.split('"')[-1] != '':
-                            continue
-                    else:
-                        if len(title.split(',')) != 1:
-                            continue
-                    title = title.strip('"')
+    def __year_month(self):
+        self._require_rows()
+        if self._year_month is None:
+            self._year_month = year_month_columns(self.ratings.timestamps, self.tz)
+        return self._year_month
 
-                    genres = [g.strip() for g in genres_str.split('|')] if genres_str else []
+    @property
+    def movie_stats(self):
+        """
+        MovieStats по всем оценкам; строится при первом обращении и общий
+        для всех Ratings.Movies этого объекта.
+        """
+        if self._movie_stats is None:
+            self._movie_stats = MovieStats(self.ratings.movie_ids, self.ratings.rating_values,
+                                           self.quantiles, self.sketch_k)
+        return self._movie_stats
 
-                    try:
-                        movies.append({
-                            "movieId": int(movie_id_str),
-                            "title": title,
-                            "genres": genres
-                        })
-                    except ValueError:
-                        continue
+    def __load_file(self, max_lines=1000):
+        return MovieCatalog.parse(self._movies_path, max_lines)
 
-        except Exception as e:
-            print(f"Ошибка при чтении файла Movies: {e}")
-        return movies
+    @property
+    def movie_index(self):
+        """
+        CsrIndex оценок по movieId; строится при первом обращении.
+        """
+        self._require_rows()
+        if self._movie_index is None:
+            self._movie_index = CsrIndex(self.ratings.movie_ids)
+        return self._movie_index
+
+    @property
+    def user_index(self):
+        """
+        CsrIndex оценок по userId; строится при первом обращении.
+        """
+        self._require_rows()
+        if self._user_index is None:
+            self._user_index = CsrIndex(self.ratings.user_ids)
+        return self._user_index
+
+    @property
+    def user_stats(self):
+        """
+        UserStats по всем оценкам; общий для всех Ratings.Users этого объекта.
+        """
+        if self._user_stats is None:
+            self._user_stats = UserStats(self.user_index, self.ratings.rating_values,
+                                         self.quantiles, self.sketch_k)
+        return self._user_stats
+
+    @property
+    def rating_matrix(self):
+        """
+        RatingMatrix пользователь x фильм; строится при первом обращении
+        и сбрасывается при append.
+        """
+        self._require_rows()
+        if self._matrix is None:
+            if self.user_index.size < len(self.ratings):
+                # индекс отстал после append — матрице нужны все строки
+                self._user_index = CsrIndex(self.ratings.user_ids)
+            self._matrix = RatingMatrix(self.ratings, self.user_index)
+        return self._matrix
+
+    def item_similarity(self, method="cosine", k=20, min_common=1, workers=None):
+        """
+        ItemSimilarity для этих оценок. Результат запоминается и, если оценки
+        не менялись после загрузки, сохраняется в SidecarCache рядом с
+        ratings.csv, так что при следующем запуске соседи читаются с диска.
+        """
+        self._require_rows()
+        key = (method, k, min_common)
+        if key not in self._similarity:
+            cache = None
+            if self._use_cache and len(self.ratings) == self._loaded_rows:
+                cache = SidecarCache(self._path, ("similarity",) + key + self._cache_key, self._cache_dir)
+            columns = cache.load() if cache else None
+            if columns is not None:
+                similarity = ItemSimilarity.from_columns(columns)
+            else:
+                similarity = ItemSimilarity.build(self, method, k, min_common, workers=workers)
+                if cache:
+                    cache.save(similarity.columns())
+            self._similarity[key] = similarity
+        return self._similarity[key]
+
+    def user_rows(self, user_id):
+        """
+        Номера строк оценок пользователя в порядке файла.
+        """
+        index = self.user_index
+        rows = list(index.rows(user_id))
+        store = self.ratings
+        if index.size < len(store):
+            rows.extend(row for row in range(index.size, len(store)) if store.user_ids[row] == user_id)
+        return rows
 
     def get_ratings_for_movies(self, movie_ids):
-        return [r["rating"] for r in self.ratings if r["movieId"] in movie_ids]
+        """
+        Оценки фильмов movie_ids в порядке файла: строки берутся срезами
+        movie_index, а не проходом по всем оценкам.
+        """
+        store = self.ratings
+        index = self.movie_index
+        # movieId в колонке — числа, остальные элементы movie_ids ни с чем не совпадут
+        wanted = dict.fromkeys(mid for mid in movie_ids if isinstance(mid, (int, float)))
+        groups = [index.rows(mid) for mid in wanted]
+        rows = groups[0] if len(groups) == 1 else sorted(row for group in groups for row in group)
+        ratings = [store.rating_values[row] for row in rows]
+        if index.size < len(store):
+            # строки, добавленные через append после построения индекса
+            tail = zip(store.movie_ids[index.size:], store.rating_values[index.size:])
+            ratings.extend(rating for mid, rating in tail if mid in movie_ids)
+        return ratings
 
     @staticmethod
     def extract_year_from_title(title: str) -> int | None:
-        if not title or not isinstance(title, str):
-            return None
-        start = title.rfind("(")
-        end = title.rfind(")")
-        if start != -1 and end != -1 and end > start:
-            year_str = title[start + 1:end]
-            if year_str.isdigit() and len(year_str) == 4:
-                return int(year_str)
-        return None
+        return extract_year_from_title(title)
 
     class Movies:
         def __init__(self, parent, movies_list):
@@ -654,50 +2963,56 @@ class Ratings:
             self.ratings = parent.ratings
             self.movie_titles = parent.movie_titles
             self.movies = movies_list
+            self.catalog = parent.catalog if movies_list is parent.catalog.rows else MovieCatalog(movies_list)
 
         def dist_by_year(self):
-            result = defaultdict(int)
-            for r in self.ratings:
-                try:
-                    timestamp = int(r["timestamp"])
-                    year = datetime.fromtimestamp(timestamp, tz=timezone.utc).year
-                    result[year] += 1
-                except (KeyError, ValueError, TypeError) as e:
-                    print(f"⚠️ Пропущена запись с ошибкой: {r} — {e}")
-                    continue
-            return dict(sorted(result.items()))
+            return dict(sorted(Counter(self.parent.rating_years).items()))
 
         def dist_by_rating(self):
-            result = defaultdict(int)
-            for r in self.ratings:
-                try:
-                    result[r["rating"]] += 1
-                except (KeyError, ValueError, TypeError) as e:
-                    print(f"⚠️ Пропущена запись с ошибкой: {r} — {e}")
-                    continue
-            return dict(sorted(result.items()))
+            if self.ratings is None:
+                # оценки не хранятся — складываем гистограммы фильмов
+                histogram = RatingHistogram()
+                for movie in self.parent.movie_stats.histograms.values():
+                    histogram.merge(movie)
+                return dict(histogram.items())
+            return dict(sorted(Counter(self.ratings.rating_values).items()))
+
+        def rolling_ratings(self, period="day", window=7, movie_id=None):
+            """
+            Скользящие число оценок и средний рейтинг за window периодов
+            ("day", "week" или "month") по всем фильмам или по movie_id:
+            {начало периода: {"Средний рейтинг", "оценок"}}.
+            """
+            rolling = self.parent.time_series(period).rolling(window, movie_id)
+            return {
+                start: {"Средний рейтинг": round(total / count, 2) if count else None, "оценок": count}
+                for start, (count, total) in rolling.items()
+            }
+
+        def trending(self, n, period="day", window=7):
+            """
+            Фильмы с наибольшим числом оценок за последние window периодов.
+            """
+            top = self.parent.time_series(period).trending(n, window)
+            return {self.movie_titles.get(mid, f"[ID {mid}]"): count for mid, count in top}
 
         def top_by_num_of_ratings(self, n):
-            counts = defaultdict(int)
-            for r in self.ratings:
-                try:
-                    counts[r["movieId"]] += 1
-                except (KeyError, ValueError, TypeError) as e:
-                    print(f"⚠️ Пропущена запись с ошибкой: {r} — {e}")
-                    continue
-            sorted_counts = sorted(counts.items(), key=lambda x: x[1], reverse=True)[:n]
+            counts = self.parent.movie_stats.counts
+            sorted_counts = top_n(counts.items(), n)
             return {self.movie_titles[mid]: count for mid, count in sorted_counts}
 
         def top_by_ratings(self, n, metric="average"):
-            scores = defaultdict(list)
-            for r in self.ratings:
-                scores[r["movieId"]].append(r["rating"])
+            """
+            metric: "average", "median" или перцентиль "pNN" (например, "p90").
+            """
+            stats = self.parent.movie_stats
+            q = metric_quantile(metric)
             result = {}
-            for mid, values in scores.items():
-                if len(values) < 2:
+            for mid, count in stats.counts.items():
+                if count < 2:
                     continue
-                result[mid] = round(mean(values), 2) if metric == "average" else round(median(values), 2)
-            top = sorted(result.items(), key=lambda x: x[1], reverse=True)[:n]
+                result[mid] = round(stats.mean(mid), 2) if q is None else round(stats.quantile(mid, q), 2)
+            top = top_n(result.items(), n)
             return {
                 self.movie_titles[mid]: score
                 for mid, score in top
@@ -705,53 +3020,53 @@ class Ratings:
             }
 
         def top_controversial(self, n):
-            scores = defaultdict(list)
-            for r in self.ratings:
-                scores[r["movieId"]].append(r["rating"])
+            stats = self.parent.movie_stats
             variances = {}
-            for mid, vals in scores.items():
-                if len(vals) < 2:
+            for mid, count in stats.counts.items():
+                if count < 2:
                     continue
-                variances[mid] = round(variance(vals), 2)
-            top = sorted(variances.items(), key=lambda x: x[1], reverse=True)[:n]
+                variances[mid] = round(stats.variance(mid), 2)
+            top = top_n(variances.items(), n)
             return {self.movie_titles[mid]: var
                     for mid, var in top
                     if mid in self.movie_titles}
         
-        def average_genre_rating_by_year(self, genre_filter=None, release_year=None):
-            movie_genres = {}
-            movie_years = {}
-            matching_movies = set()
-            for movie in self.movies:
-                movie_id = movie.get("movieId")
-                title = movie.get("title", "")
-                genres = movie.get("genres", "")
-                year = Ratings.extract_year_from_title(title)
-                if year is not None:
-                    movie_years[movie_id] = year
-                if isinstance(genres, str):
-                    genres = genres.split("|")
-                movie_genres[movie_id] = genres
-                genre_match = genre_filter is None or genre_filter in genres
-                year_match = release_year is None or year == release_year
-                if genre_match and year_match:
-                    matching_movies.add(movie_id)
-            rating_by_year = defaultdict(list)
-            for r in self.ratings:
-                movie_id = r["movieId"]
-                if movie_id not in matching_movies:
-                    continue
-                try:
-                    ts = int(r["timestamp"])
-                    rating_year = datetime.fromtimestamp(ts).year
-                    rating = float(r["rating"])
-                except (ValueError, KeyError, TypeError):
+        def similar_movies(self, movie_id, n=10, method="cosine"):
+            """
+            Фильмы, похожие на movie_id по оценкам пользователей: {название: сходство}.
+            """
+            similarity = self.parent.item_similarity(method, k=max(n, 20))
+            return {
+                self.movie_titles.get(mid, f"[ID {mid}]"): round(score, 3)
+                for mid, score in similarity.similar(movie_id, n)
+            }
+
+        def average_genre_rating_by_year(self, genre_filter=None, release_year=None, match="any"):
+            """
+            genre_filter — жанр или набор жанров (match="any" или "all").
+            """
+            cube = self.parent.cube_for(self.catalog, genre_filter, match)
+            if cube is not None:
+                return {
+                    year: {
+                        "count": cell["count"],
+                        "average_rating": round(cell["sum"] / cell["count"], 2)
+                    }
+                    for year, cell in sorted(cube.rollup("rating_year", genre_filter, release_year).items())
+                }
+            movie_years = self.catalog.years
+            store = self.ratings
+            flags = self.catalog.genre_flags(self.parent.genre_masks_for(self.catalog), genre_filter, match)
+            rating_by_year = defaultdict(RunningStats)
+            rows = compress(zip(store.movie_ids, store.rating_values, self.parent.rating_years), flags)
+            for movie_id, rating, rating_year in rows:
+                if release_year is not None and movie_years.get(movie_id) != release_year:
                     continue
-                rating_by_year[rating_year].append(rating)
+                rating_by_year[rating_year].add(rating)
             result = {
                 year: {
-                    "count": len(ratings),
-                    "average_rating": round(mean(ratings), 2)
+                    "count": ratings.count,
+                    "average_rating": round(ratings.mean, 2)
                 }
                 for year, ratings in sorted(rating_by_year.items())
             }
@@ -762,75 +3077,95 @@ class Ratings:
         def __init__(self, parent, movies):
             self.parent = parent
             self.ratings = parent.ratings
-            self.movie_genres = {}
-            self.movie_years = {}
-
-            for m in movies:
-                title = m.get("title", "")
-                movie_id = m.get("movieId")
-                if not isinstance(title, str) or movie_id is None:
-                    continue
-
-                self.movie_genres[movie_id] = m.get("genres", [])
-
-                year = Ratings.extract_year_from_title(title)
-                if year is not None:
-                    self.movie_years[movie_id] = year
+            self.catalog = parent.catalog if movies is parent.catalog.rows else MovieCatalog(movies)
+            self.movie_genres = self.catalog.genres
+            self.movie_years = self.catalog.years
 
         def dist_by_num_of_ratings(self):
-            rating_to_users = defaultdict(set)
-            for r in self.ratings:
-                try:
-                    rating = r["rating"]
-                    user_id = r["userId"]
-                    rating_to_users[rating].add(user_id)
-                except (KeyError, ValueError, TypeError) as e:
-                    print(f"{r} — {e}")
-                    continue
-            result = {rating: len(users) for rating, users in rating_to_users.items()}
+            result = defaultdict(int)
+            for histogram in self.parent.user_stats.histograms.values():
+                for rating, _ in histogram.items():
+                    result[rating] += 1
             return dict(sorted(result.items()))
                     
         def dist_by_user_rating(self, metric="average"):
-            users = defaultdict(list)
-            for r in self.ratings:
-                try:
-                    users[r["userId"]].append(r["rating"])
-                except (KeyError, TypeError):
-                    continue
+            """
+            metric: "average", "median" или перцентиль "pNN" (например, "p90").
+            """
+            q = metric_quantile(metric)
+            stats = self.parent.user_stats
             dist = defaultdict(int)
-            for ratings in users.values():
-                if not ratings:
-                    continue
-                val = round(mean(ratings), 1) if metric == "average" else round(median(ratings), 1)
+            for uid, ratings in stats.stats.items():
+                val = round(ratings.mean, 1) if q is None else round(stats.quantile(uid, q), 1)
                 dist[val] += 1
             return dict(sorted(dist.items()))
 
         def top_controversial(self, n):
-            users = defaultdict(list)
-            for r in self.ratings:
-                users[r["userId"]].append(r["rating"])
             variances = {}
-            for uid, vals in users.items():
-                if len(vals) < 2:
+            for uid, stats in self.parent.user_stats.stats.items():
+                if stats.count < 2:
                     continue
-                variances[uid] = round(variance(vals), 2)
-            top = sorted(variances.items(), key=lambda x: x[1], reverse=True)[:n]
+                variances[uid] = round(stats.variance, 2)
+            top = top_n(variances.items(), n)
             return dict(top)
 
-        def genre_rating_trend_by_year(self, genre_filter: str = "Drama"):
-            ratings_by_year = defaultdict(list)
-            users_by_year = defaultdict(set)
-            for r in self.ratings:
-                movie_id = r["movieId"]
-                genres = self.movie_genres.get(movie_id, [])
-                if genre_filter in genres:
-                    rating_year = datetime.fromtimestamp(r["timestamp"]).year
-                    ratings_by_year[rating_year].append(r["rating"])
-                    users_by_year[rating_year].add(r["userId"])
+        def user_history(self, user_id):
+            """
+            Оценки пользователя в порядке файла: список словарей
+            {"movieId", "rating", "timestamp"}.
+            """
+            store = self.ratings
+            return [
+                {"movieId": store.movie_ids[row], "rating": store.rating_values[row],
+                 "timestamp": store.timestamps[row]}
+                for row in self.parent.user_rows(user_id)
+            ]
+
+        def activity_span(self, user_id):
+            """
+            Период активности пользователя: первая и последняя оценка (в
+            часовом поясе Ratings.tz) и число дней между ними; None, если оценок нет.
+            """
+            timestamps = [self.ratings.timestamps[row] for row in self.parent.user_rows(user_id)]
+            if not timestamps:
+                return None
+            first, last = min(timestamps), max(timestamps)
+            return {
+                "first": datetime.fromtimestamp(first, tz=self.parent.tz),
+                "last": datetime.fromtimestamp(last, tz=self.parent.tz),
+                "days": (last - first) // 86400,
+                "count": len(timestamps)
+            }
+
+        def genre_rating_trend_by_year(self, genre_filter: str = "Drama", match="any",
+                                       distinct="exact", error=0.01):
+            """
+            genre_filter — жанр или набор жанров (match="any" или "all").
+            distinct="approx" считает пользователей через HyperLogLog с
+            относительной ошибкой error вместо множеств userId.
+            """
+            cube = self.parent.cube_for(self.catalog, genre_filter, match)
+            if cube is not None and cube.distinct == distinct:
+                return {
+                    year: {
+                        "Средний рейтинг": round(cell["sum"] / cell["count"], 2),
+                        "оценок": cell["count"],
+                        "пользователей": len(cell["users"])
+                    }
+                    for year, cell in sorted(cube.rollup("rating_year", genre_filter).items())
+                }
+            ratings_by_year = defaultdict(RunningStats)
+            users_by_year = defaultdict(distinct_counter(distinct, error))
+            store = self.ratings
+            flags = self.catalog.genre_flags(self.parent.genre_masks_for(self.catalog), genre_filter, match)
+            rows = compress(zip(store.user_ids, store.rating_values, self.parent.rating_years), flags)
+            for user_id, rating, rating_year in rows:
+                ratings_by_year[rating_year].add(rating)
+                users_by_year[rating_year].add(user_id)
             result = {
                 year: {
-                    "Средний рейтинг": round(mean(ratings), 2), 
-                    "оценок": len(ratings),
+                    "Средний рейтинг": round(ratings.mean, 2), 
+                    "оценок": ratings.count,
                     "пользователей": len(users_by_year[year]) 
                 }
                 for year, ratings in sorted(ratings_by_year.items())
@@ -839,36 +3174,99 @@ class Ratings:
 
 
 class Tags:
-    def __init__(self, path_to_the_file, movie_ids):
+    def __init__(self, path_to_the_file, movie_ids, count_lines=1000, chunk_size=10000, use_cache=True,
+                 workers=1, cache_dir=None):
+        """
+        count_lines — сколько тегов прочитать; None читает файл целиком
+        пачками по chunk_size строк, а при workers > 1 — параллельно.
+        cache_dir — каталог для SidecarCache (по умолчанию рядом с файлом).
+        """
         self.tags = set()
         self.tag_list = []
+        self.tag_counts = Counter()
         self.movie_tags = {}
         self.valid_movie_ids = set(movie_ids)
-
-        rows = read_csv_as_dict(path_to_the_file, count_lines=1000, valid_movie_ids=movie_ids)
+        self._path = path_to_the_file
+        try:
+            self._offset = os.path.getsize(path_to_the_file) if count_lines is None else None
+        except OSError:
+            self._offset = None
+
+        cache = SidecarCache(path_to_the_file, ("tags", count_lines, ids_digest(movie_ids)), cache_dir) if use_cache else None
+        columns = cache.load() if cache else None
+        if columns is not None and "offset" in columns:
+            self._offset = columns.pop("offset")[0]
+        if columns is None and count_lines is None and workers > 1:
+            try:
+                columns = read_columns_parallel(path_to_the_file, workers=workers, valid_movie_ids=movie_ids,
+                                                end=self._offset)
+            except Exception as e:
+                print(f"Ошибка при чтении файла: {e}")
+                columns = {"movieId": array('i'), "tag": []}
+            if cache:
+                cache.save(with_offset(columns, self._offset))
+        if columns is None:
+            columns = {"movieId": array('i'), "tag": []}
+            chunks = read_csv_chunks(path_to_the_file, chunk_size=chunk_size, count_lines=count_lines,
+                                     valid_movie_ids=movie_ids, end=self._offset)
+            for chunk in chunks:
+                for row in chunk:
+                    try:
+                        tag = row.get("tag", "").strip()
+                        movie_id = int(row.get("movieId", 0))
+                        if tag:
+                            columns["movieId"].append(movie_id)
+                            columns["tag"].append(tag)
+                    except Exception as e:
+                        print(f"Ошибка при обработке строки: {row}, ошибка: {e}")
+            if cache:
+                cache.save(with_offset(columns, self._offset))
+
+        self.__add_tags(columns["movieId"], columns["tag"])
+
+    def __add_tags(self, movie_ids, tags):
+        for movie_id, tag in zip(movie_ids, tags):
+            self.tags.add(tag)
+            self.tag_list.append(tag)
+            self.movie_tags.setdefault(movie_id, []).append(tag)
+        self.tag_counts.update(tags)
+
+    def append(self, rows):
+        """
+        Добавляет теги (словари с ключами movieId и tag) в tags, tag_list,
+        movie_tags и tag_counts. Возвращает число добавленных тегов.
+        """
+        movie_ids, tags = [], []
         for row in rows:
             try:
                 tag = row.get("tag", "").strip()
                 movie_id = int(row.get("movieId", 0))
-
-                if tag:
-                    self.tags.add(tag)
-                    self.tag_list.append(tag)
-                    self.movie_tags.setdefault(movie_id, []).append(tag)
+                if tag and movie_id in self.valid_movie_ids:
+                    movie_ids.append(movie_id)
+                    tags.append(tag)
             except Exception as e:
                 print(f"Ошибка при обработке строки: {row}, ошибка: {e}")
+        self.__add_tags(movie_ids, tags)
+        return len(tags)
+
+    def append_file(self, path=None):
+        """
+        Как Ratings.append_file: path=None дочитывает дописанный хвост
+        исходного tags.csv, иначе читается отдельный файл с заголовком.
+        """
+        if path is not None:
+            return self.append(read_csv_tail(path, 0)[0])
+        if self._offset is None:
+            print("Ошибка: дочитывать можно только файл, загруженный целиком (count_lines=None)")
+            return 0
+        rows, self._offset = read_csv_tail(self._path, self._offset)
+        return self.append(rows)
 
     def most_words(self, n):
-        return dict(
-            sorted(
-                {tag: len(tag.split()) for tag in self.tags}.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )[:n]
-        )
+        return dict(top_n(((tag, len(tag.split())) for tag in self.tags), n))
 
     def longest(self, n):
-        return sorted(self.tags, key=lambda x: (-len(x), x))[:n]
+        return top_n(self.tags, n, key=lambda x: (-len(x), x), reverse=False)
 
     def most_words_and_longest(self, n):
         top_words = set(self.most_words(n).keys())
@@ -877,7 +3275,7 @@ class Tags:
         return sorted(intersected, key=lambda tag: (-len(tag.split()), -len(tag)))
 
     def most_popular(self, n):
-        return dict(Counter(self.tag_list).most_common(n))
+        return dict(self.tag_counts.most_common(n))
 
     def tags_with(self, word):
         word = word.lower()
@@ -888,9 +3286,7 @@ class Tags:
 
     def top_movies_by_tag(self, tag_name, ratings_obj, movies_obj, n=10):
         tag_name = tag_name.lower()
-
-        movies = movies_obj.get_movies()
-        movie_title_map = {int(m['movieId']): m['title'] for m in movies}
+        movie_title_map = movies_obj.catalog.titles
 
         movie_ids = [
             mid for mid, tags in self.movie_tags.items()
@@ -898,29 +3294,23 @@ class Tags:
         ]
         avg_ratings = {}
         for mid in movie_ids:
+            # срез по movie_index вместо прохода по всем оценкам
             ratings = ratings_obj.get_ratings_for_movies([mid])
             if ratings:
                 avg = sum(ratings) / len(ratings)
                 title = movie_title_map.get(mid, f"[ID {mid}]")
                 avg_ratings[title] = round(avg, 2)
 
-        sorted_avg = dict(sorted(avg_ratings.items(), key=lambda x: x[1], reverse=True)[:n])
+        sorted_avg = dict(top_n(avg_ratings.items(), n))
         return sorted_avg
 
     def tag_statistics(self, movies_obj):
-        movies = movies_obj.get_movies()
-
-        valid_movie_ids = set(int(m.get("movieId")) for m in movies)
+        movie_title_map = movies_obj.catalog.titles
 
-        movie_title_map = {int(m['movieId']): m['title'] for m in movies}
-        
         stats = {}
-        for mid, tags in self.movie_tags.items():
-
-            movie_id = int(mid)
-            if movie_id in valid_movie_ids:
-                title = movie_title_map.get(movie_id, f"[ID {movie_id}]")
-                stats[title] = len(tags)
+        for movie_id, tags in self.movie_tags.items():
+            if movie_id in movie_title_map:
+                stats[movie_title_map[movie_id]] = len(tags)
 
         sorted_stats = dict(sorted(stats.items(), key=lambda x: x[1], reverse=True))
 
@@ -945,6 +3335,29 @@ class Tests:
     RATINGS_FILE = "../datasets/ml-latest-small/ratings.csv"
     LINKS_FILE = "../datasets/ml-latest-small/links.csv"
     TAGS_FILE = "../datasets/ml-latest-small/tags.csv"
+    # сокращенные страницы IMDb для test_links.csv: только узлы, которые читает Links
+    IMDB_PAGE = ('<html><head><title>{title} - IMDb</title></head><body><h1><span>{title}</span></h1>'
+                 '<ul><li data-testid="title-pc-principal-credit"><span>Director</span>'
+                 '<ul><li><a href="/name/">{director}</a></li></ul></li></ul>'
+                 '<div><div>IMDb RATING</div><a><div><span>{rating}</span><span>/10</span></div></a></div>'
+                 '<li data-testid="title-boxoffice-budget"><span>Budget</span>'
+                 '<ul><li><span>{budget} (estimated)</span></li></ul></li>'
+                 '<li data-testid="title-boxoffice-cumulativeworldwidegross"><span>Gross worldwide</span>'
+                 '<ul><li><span>{gross}</span></li></ul></li>'
+                 '<li data-testid="title-techspec_runtime">Runtime{runtime}</li></body></html>')
+    IMDB_MOVIES = {
+        '0114709': ('История игрушек', 'John Lasseter', '8.3', '$30,000,000', '$394,436,586', '1 hour 21 minutes'),
+        '0113497': ('Джуманджи', 'Joe Johnston', '7.1', '$65,000,000', '$262,821,940', '1 hour 44 minutes'),
+        '0113228': ('Старые ворчуны разбушевались', 'Howard Deutch', '6.6', '$25,000,000', '$71,518,503',
+                    '1 hour 41 minutes'),
+        '0114885': ('В ожидании выдоха', 'Forest Whitaker', '6.0', '$16,000,000', '$81,452,156', '2 hours 4 minutes'),
+        '0113041': ('Отец невесты 2', 'Charles Shyer', '6.1', '$30,000,000', '$76,594,107', '1 hour 46 minutes'),
+        '0113277': ('Схватка', 'Michael Mann', '8.3', '$60,000,000', '$187,436,818', '2 hours 50 minutes'),
+        '0114319': ('Сабрина', 'Sydney Pollack', '6.3', '$58,000,000', '$87,100,000', '2 hours 7 minutes'),
+        '0112302': ('Том и Гек', 'Peter Hewitt', '5.5', '$15,000,000', '$23,920,048', '1 hour 37 minutes'),
+        '0114576': ('Внезапная смерть', 'Peter Hyams', '5.8', '$35,000,000', '$64,350,171', '1 hour 51 minutes'),
+        '0113189': ('Золотой глаз', 'Martin Campbell', '7.2', '$60,000,000', '$352,194,034', '2 hours 10 minutes'),
+    }
 
 
     @staticmethod
@@ -997,6 +3410,17 @@ class Tests:
             f.write(content)
             
 
+    @staticmethod
+    def create_imdb_cache(path):
+        """
+        ImdbCache со страницами IMDB_MOVIES — тесты Links работают без сети.
+        """
+        cache = ImdbCache(path, ttl=None)
+        for imdb_id, (title, director, rating, budget, gross, runtime) in Tests.IMDB_MOVIES.items():
+            cache.put_html(imdb_id, Tests.IMDB_PAGE.format(title=title, director=director, rating=rating,
+                                                           budget=budget, gross=gross, runtime=runtime))
+        return cache
+
     @staticmethod
     def create_test_tags_file():
         content = """userId,movieId,tag,timestamp
@@ -1035,6 +3459,44 @@ class Tests:
             assert isinstance(data, list)
             assert all(isinstance(row, dict) for row in data)
 
+        def test_read_csv_chunks(self):
+            gen = read_csv_chunks(Tests.TEST_RATINGS_FILE, chunk_size=4)
+            assert 'generator' in str(type(gen))
+            chunks = list(gen)
+            assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+            assert sum(chunks, []) == read_csv_as_dict(Tests.TEST_RATINGS_FILE)
+            assert sum(len(c) for c in read_csv_chunks(Tests.TEST_RATINGS_FILE, chunk_size=4, count_lines=5)) == 5
+
+        def test_sidecar_cache(self, tmp_path):
+            source = tmp_path / "ratings.csv"
+            source.write_text("userId,movieId,rating,timestamp\n1,1,4.0,964982703\n")
+            cache = SidecarCache(str(source), ("ratings", None))
+            assert cache.load() is None
+            cache.save({"movieId": array('i', [1, 2, 3]), "rating": array('f', [4.0, 3.5, 0.5]),
+                        "tag": ["dark comedy", "", "Оскар"]})
+            columns = cache.load()
+            assert isinstance(columns["movieId"], memoryview)
+            assert list(columns["movieId"]) == [1, 2, 3]
+            assert list(columns["rating"]) == [4.0, 3.5, 0.5]
+            assert columns["tag"] == ["dark comedy", "", "Оскар"]
+            source.write_text("userId,movieId,rating,timestamp\n1,1,4.0,964982703\n2,1,3.0,964982703\n")
+            assert cache.load() is None
+            shared = SidecarCache(str(source), ("tags", None), str(tmp_path / "cache"))
+            shared.save({"tag": ["a", "b"]})
+            assert os.path.dirname(shared.path) == str(tmp_path / "cache")
+            assert shared.load() == {"tag": ["a", "b"]}
+            assert sorted(os.listdir(tmp_path)) == sorted(["cache", "ratings.csv", os.path.basename(cache.path)])
+
+        @pytest.mark.parametrize("file_path", ["test_raitings.csv", "test_tags.csv"])
+        def test_read_columns_parallel(self, file_path):
+            ranges = split_byte_ranges(file_path, 4)
+            assert all(ranges[i][1] == ranges[i + 1][0] for i in range(len(ranges) - 1))
+            columns = read_columns_parallel(file_path, workers=2)
+            rows = read_csv_as_dict(file_path)
+            assert list(columns["movieId"]) == [int(row["movieId"]) for row in rows]
+            only_first = read_columns_parallel(file_path, workers=2, valid_movie_ids={1, 339})
+            assert set(only_first["movieId"]) <= {1, 339}
+
         def test_mean(self):
             assert isinstance(mean([1, 2, 3, 4, 5]), float)
             assert mean([1, 2, 3, 4, 5]) == 3.0
@@ -1050,12 +3512,117 @@ class Tests:
             assert isinstance(variance([1, 2, 3, 4, 5]), float)
             assert variance([1, 2, 3, 4, 5]) == pytest.approx(2.5)
             assert variance([]) == 0
+            assert round(variance([5.0, 0.5, 4.0, 2.0, 3.5]), 2) == 3.12
+
+        def test_rating_histogram(self):
+            values = [4.0, 3.5, 5.0, 1.0, 2.5, 4.5, 3.0, 4.0, 0.5, 3.0]
+            for size in range(1, len(values) + 1):
+                assert RatingHistogram(values[:size]).median() == median(values[:size])
+            histogram = RatingHistogram(values[:4]).merge(RatingHistogram(values[4:]))
+            assert histogram.count == len(values)
+            assert histogram.quantile(0) == 0.5 and histogram.quantile(1) == 5.0
+            assert histogram.quantile(0.9) == pytest.approx(4.55)
+            assert RatingHistogram([3.7, 4.0]).median() == pytest.approx(3.85)
+            assert RatingHistogram().median() == 0
+            assert metric_quantile("average") is None
+            assert metric_quantile("median") == 0.5
+            assert metric_quantile("p90") == 0.9
+
+        def test_year_month_columns(self):
+            timestamps = array('q', [964982703, 1445714835, 946684800, 946684799, 1199145600 - 3 * 3600])
+            for tz in (timezone.utc, timezone(timedelta(hours=3)), timezone(timedelta(hours=-5))):
+                years, months = year_month_columns(timestamps, tz)
+                expected = [datetime.fromtimestamp(ts, tz=tz) for ts in timestamps]
+                assert list(years) == [d.year for d in expected]
+                assert list(months) == [d.month for d in expected]
+            assert year_month_columns(array('q')) == (array('H'), array('B'))
+
+        def test_period_columns(self):
+            timestamps = array('q', [964982703, 1445714835, 946684800, 946684799, 1199145600 - 3 * 3600])
+            for tz in (timezone.utc, timezone(timedelta(hours=3)), timezone(timedelta(hours=-5))):
+                days = [datetime.fromtimestamp(ts, tz=tz).date() for ts in timestamps]
+                assert list(period_columns(timestamps, "day", tz)) == [d.toordinal() for d in days]
+                assert list(period_columns(timestamps, "week", tz)) == \
+                       [(d - timedelta(days=d.weekday())).toordinal() for d in days]
+                assert list(period_columns(timestamps, "month", tz)) == [d.replace(day=1).toordinal() for d in days]
+            assert next_period(date(1999, 12, 1), "month") == date(2000, 1, 1)
+            assert period_columns(array('q'), "week") == array('i')
+            with pytest.raises(ValueError):
+                period_columns(timestamps, "year")
+
+        def test_top_n(self):
+            items = [("a", 3), ("b", 5), ("c", 3), ("d", 1), ("e", 5), ("f", 3)]
+            for n in range(-2, len(items) + 2):
+                assert top_n(items, n) == sorted(items, key=lambda x: x[1], reverse=True)[:n]
+                assert top_n(items, n, reverse=False) == sorted(items, key=lambda x: x[1])[:n]
+            assert top_n(iter(items), 3) == [("b", 5), ("e", 5), ("a", 3)]
+
+        def test_kll_sketch(self):
+            values = [((i * 7919) % 10007) / 100 for i in range(20000)]
+            small = KllSketch(200, values[:150])
+            assert len(small.levels) == 1
+            for q in (0, 0.25, 0.5, 0.9, 1):
+                assert small.quantile(q) == pytest.approx(RatingHistogram(values[:150]).quantile(q))
+            assert small.median() == median(values[:150])
+            ordered = sorted(values)
+            left, right = KllSketch(200, values[:12000]), KllSketch(200, values[12000:])
+            for sketch in (KllSketch(200, values), left.merge(right)):
+                assert sketch.count == len(values)
+                assert sum(len(items) << level for level, items in enumerate(sketch.levels)) == len(values)
+                assert sum(map(len, sketch.levels)) < 1000
+                for q in (0.1, 0.5, 0.9):
+                    rank = bisect_right(ordered, sketch.quantile(q)) / len(values)
+                    assert abs(rank - q) < 0.03
+            assert KllSketch().quantile(0.5) == 0
+
+        @pytest.mark.parametrize("k", [50, 200])
+        def test_kll_sketch_compaction(self, k):
+            n = 50 * k
+            values = [((i * 7919) % n) / 10 for i in range(n)]  # перестановка 0..n-1
+            sketch = KllSketch(k, values)
+            assert len(sketch.levels) > 2
+            assert sum(map(len, sketch.levels)) < 3 * k
+            ordered = sorted(values)
+            # ошибка ранга KLL ~ 1.65% при k=200 и растет как 1/k
+            tolerance = 2 * 0.0165 * 200 / k
+            for i in range(1, 100):
+                q = i / 100
+                rank = bisect_right(ordered, sketch.quantile(q)) / n
+                assert abs(rank - q) < tolerance
+
+        def test_hyperloglog(self):
+            for error in (0.05, 0.01):
+                sketch = HyperLogLog(error, range(50000))
+                assert abs(sketch.count() - 50000) < 3 * error * 50000
+            left, right = HyperLogLog(0.02, range(0, 6000)), HyperLogLog(0.02, range(3000, 9000))
+            whole = HyperLogLog(0.02, range(9000))
+            assert left.copy().merge(right).registers == whole.registers
+            small = HyperLogLog(0.01, [1, 2, 3, 3, 2])
+            assert small.registers is None and len(small) == 3
+            small |= HyperLogLog(0.01, [4])
+            assert len(small) == 4
+            with pytest.raises(ValueError):
+                small.merge(HyperLogLog(0.1))
+
+        def test_running_stats_merge(self):
+            values = [4.0, 3.5, 5.0, 1.0, 2.5, 4.5, 3.0]
+            whole = RunningStats(values)
+            merged = RunningStats(values[:3]).merge(RunningStats(values[3:])).merge(RunningStats())
+            assert merged.count == whole.count == 7
+            assert merged.mean == whole.mean == mean(values)
+            assert merged.variance == whole.variance == statistics.variance(values)
+            # вне сетки полузвезд — состояние Уэлфорда
+            values = [x + 1e9 + 0.1 for x in values]
+            merged = RunningStats(values[:3]).merge(RunningStats(values[3:]))
+            assert merged.variance == pytest.approx(statistics.variance(values))
 
     class TestLinksClass:
 
         @pytest.fixture(scope="module")
-        def links_obj(self):
-            return Links(Tests.TEST_LINKS_FILE)
+        def links_obj(self, tmp_path_factory):
+            # страницы IMDb берутся только из заранее заполненного кэша
+            cache = Tests.create_imdb_cache(str(tmp_path_factory.mktemp("imdb") / "imdb.sqlite"))
+            return Links(Tests.TEST_LINKS_FILE, fetcher=ImdbFetcher(cache=cache, offline=True))
        
         def test_links_init(self, links_obj):
             assert isinstance(links_obj._path_to_the_file, str)
@@ -1063,6 +3630,101 @@ class Tests:
             assert isinstance(links_obj.imdb_info, list)
         #     print(Tests.links.imdb_info == Tests.links._Links__imdb_getter())
     
+        def test_lazy_imdb_info(self, monkeypatch):
+            calls = []
+            def fake_get_imdb(list_of_movies, list_of_fields, fetcher=None):
+                calls.append(list(list_of_movies))
+                return [[movie] + ['-'] * len(list_of_fields) for movie in list_of_movies]
+            monkeypatch.setattr(Links, "get_imdb", staticmethod(fake_get_imdb))
+            links = Links(Tests.TEST_LINKS_FILE)
+            assert calls == []
+            assert len(links.load_imdb_info(['0114709', '0113497'])) == 2
+            assert [row[0] for row in links.imdb_info] == sorted(links.dict_file[:10], reverse=True)
+            links.top_directors(3)
+            assert calls == [['0114709', '0113497'], [m for m in links.dict_file[:10] if m not in ('0114709', '0113497')]]
+
+        def test_fetcher_retries(self, monkeypatch):
+            class Page:
+                def __init__(self, status_code, text=""):
+                    self.status_code = status_code
+                    self.text = text
+            responses = {'1': [Page(503), Page(200, "<h1>One</h1>")], '2': [Page(404)]}
+            fetcher = ImdbFetcher(max_workers=2, requests_per_second=100, retries=2, backoff=0)
+            monkeypatch.setattr(fetcher.session, "get",
+                                lambda url, timeout: responses[url.split('tt')[-1].strip('/')].pop(0))
+            result = fetcher.fetch_many(['1', '2'])
+            assert list(result) == ['1', '2']
+            assert result['1'] == "<h1>One</h1>"
+            assert str(result['2']) == "Error page: 404"
+
+        def test_imdb_cache_offline(self, tmp_path, monkeypatch):
+            cache = ImdbCache(str(tmp_path / "imdb.sqlite"), ttl=60)
+            cache.put_html('0114709', '<html><h1>Toy Story</h1>'
+                                      '<li data-testid="title-techspec_runtime">Runtime1 hour 21 minutes</li></html>')
+            links = Links(Tests.TEST_LINKS_FILE, fetcher=ImdbFetcher(cache=cache, offline=True))
+            assert links.get_imdb(['0114709', '0113497'], ['Runtime', 'Title']) == [['0114709', '1 hour 21 minutes', 'Toy Story']]
+            assert cache.get_record('0114709')['Title'] == 'Toy Story'
+            monkeypatch.setattr(time, "time", lambda: 10 ** 12)
+            assert cache.get_html('0114709') is None
+            assert links.get_imdb(['0114709'], ['Title']) == []
+
+        def test_get_imdb_static(self):
+            class OfflineFetcher:
+                cache = None
+                def fetch_many(self, list_of_movies):
+                    return {movie: '<html><title>Toy Story (1995) - IMDb</title><h1>Toy Story</h1></html>'
+                            for movie in list_of_movies}
+            assert Links.get_imdb(['0114709'], ['Title'], fetcher=OfflineFetcher()) == [['0114709', 'Toy Story']]
+            assert Links.get_imdb_rating(['0114709'], fetcher=OfflineFetcher()) == [['0114709', 'Toy Story', None]]
+
+        def test_default_fetcher(self, tmp_path, monkeypatch):
+            monkeypatch.setitem(globals(), "IMDB_CACHE_PATH", str(tmp_path / "cache" / "imdb.sqlite"))
+            monkeypatch.setitem(globals(), "_default_fetcher", None)
+            fetcher = default_fetcher()
+            assert default_fetcher() is fetcher
+            assert fetcher.cache is not None and os.path.exists(IMDB_CACHE_PATH)
+            fetcher.offline = True
+            Tests.create_imdb_cache(IMDB_CACHE_PATH).close()
+            # статические вызовы без fetcher идут через общий кэш, без новой сессии
+            assert Links.get_imdb(['0114709'], ['Director']) == [['0114709', 'John Lasseter']]
+            assert Links(Tests.TEST_LINKS_FILE, use_cache=False).fetcher is fetcher
+            fetcher.session.close()
+            fetcher.cache.close()
+
+        def test_page_fragments(self):
+            page = ('<html><head><title>Toy Story (1995) - IMDb</title><script>var x = "<li>";</script></head>'
+                    '<body><div><h1 class="hero"><span>История игрушек</span></h1>'
+                    '<ul><li data-testid="title-pc-principal-credit"><span>Director</span>'
+                    '<ul><li><a href="/name/1">John Lasseter</a></li></ul></li></ul>'
+                    '<div><div>IMDb RATING</div><a><div><span>8.3</span><span>/10</span></div></a></div>'
+                    '<li data-testid="title-boxoffice-budget"><span>Budget</span><ul><li><span>$30,000,000</span></li></ul></li>'
+                    '<li data-testid="title-techspec_runtime">Runtime1 hour 21 minutes<br></li>'
+                    + '<p>filler</p>' * 500 + '</div></body></html>')
+            fragments = Links._page_fragments(page)
+            assert 'filler' not in fragments
+            result = Links.benchmark_parsing([page], repeat=1)
+            assert result["same_result"]
+            assert result["pages"] == 1 and result["fast_ms"] > 0
+            soup = Links._page_soup(page)
+            assert Links._Links__Make_dict(soup)['Runtime'] == '1 hour 21 minutes'
+            assert Links._Links__extract_rating(soup) == '8.3/10'
+
+        def test_crawl_resume(self, tmp_path, monkeypatch):
+            links = Links(Tests.TEST_LINKS_FILE)
+            fetched = []
+            def fetch_many(list_of_movies):
+                fetched.extend(list_of_movies)
+                return {m: Exception("timeout") if m == '0113228' else f"<h1>{m}</h1>" for m in list_of_movies}
+            monkeypatch.setattr(links.fetcher, "fetch_many", fetch_many)
+            checkpoint = str(tmp_path / "crawl.jsonl")
+            first = links.crawl(checkpoint, batch_size=3)
+            assert len(first) == 9
+            assert fetched == links.dict_file
+            fetched.clear()
+            second = links.crawl(checkpoint, batch_size=3)
+            assert fetched == ['0113228']
+            assert second == first
+
         def test_read_csv_column(self, links_obj):
             movies = Movies(Tests.MOVIES_FILE)
             movies_list = movies.get_movies()
@@ -1155,6 +3817,64 @@ class Tests:
             assert "genres" in movies_obj.movies_list[0]
 
 
+        def test_catalog_quotes(self, tmp_path):
+            path = tmp_path / "movies.csv"
+            path.write_text('movieId,title,genres\n'
+                            '1,"American President, The (1995)",Comedy|Drama|Romance\n'
+                            '2,"Great Performances"" Cats (1998)",Musical\n'
+                            '3,Broken, Title (1999),Drama\n')
+            catalog = MovieCatalog.load(str(path), use_cache=False)
+            assert dict(catalog.titles) == {1: 'American President, The (1995)', 2: 'Great Performances" Cats (1998)'}
+            assert catalog.genres[1] == ('Comedy', 'Drama', 'Romance')
+            assert catalog.years == {1: 1995, 2: 1998}
+            assert MovieCatalog.load(str(path), use_cache=False) is not catalog
+            shared = MovieCatalog.load(str(path))
+            assert MovieCatalog.load(str(path)) is shared
+            key = (os.path.abspath(path), 1000)
+            assert MovieCatalog._loaded[key] is shared
+            del shared
+            assert key not in MovieCatalog._loaded
+
+        def test_catalog_read_only(self, movies_obj):
+            row = movies_obj.movies_list[0]
+            assert isinstance(row, dict) and isinstance(row["genres"], list)
+            with pytest.raises(TypeError):
+                row["title"] = "x"
+            with pytest.raises(TypeError):
+                row["genres"].append("x")
+            with pytest.raises(TypeError):
+                movies_obj.movies_list.append({})
+
+        def test_catalog_loose_rows(self):
+            catalog = MovieCatalog([
+                {"movieId": 1, "title": "X (1995)"},
+                {"movieId": 2, "title": "Y (1996)", "genres": "Comedy|Drama"},
+                {"movieId": 3, "title": "Z", "genres": ""},
+                {"title": "No id (1997)", "genres": ["Drama"]},
+                {"movieId": 4, "title": None, "genres": ["Drama"]},
+            ])
+            assert list(catalog.titles) == [1, 2, 3]
+            assert catalog.genres == {1: (), 2: ('Comedy', 'Drama'), 3: ()}
+            assert catalog.years == {1: 1995, 2: 1996}
+
+        def test_genre_masks(self, movies_obj):
+            catalog = movies_obj.catalog
+            movie_ids = [movie["movieId"] for movie in movies_obj.movies_list] + [-1]
+            masks = catalog.mask_column(movie_ids)
+            assert masks[-1] == 0
+            assert list(catalog.row_masks) == list(masks[:-1])
+            for genres, match in (("Drama", "any"), (["Comedy", "Romance"], "any"),
+                                  (["Comedy", "Romance"], "all"), (["Drama", "Unknown"], "all"), (None, "any")):
+                wanted = [genres] if isinstance(genres, str) else genres or []
+                test = all if match == "all" else any
+                expected = [mid in catalog.genres and (not wanted or test(g in catalog.genres[mid] for g in wanted))
+                            for mid in movie_ids]
+                assert [bool(flag) for flag in catalog.genre_flags(masks, genres, match)] == expected
+            assert movies_obj.movies_by_genre(["Comedy", "Romance"], match="all") == [
+                movie["title"] for movie in movies_obj.movies_list
+                if "Comedy" in movie["genres"] and "Romance" in movie["genres"]
+            ]
+
         def test_load_file(self, movies_obj):
             result = movies_obj._Movies__load_file()
             assert isinstance(result, list)
@@ -1311,7 +4031,7 @@ class Tests:
 
             ratings = ratings_obj.ratings
 
-            assert isinstance(ratings, list)
+            assert isinstance(ratings, RatingStore)
             assert all(isinstance(rating, dict) for rating in ratings)
             # assert "userId" in ratings[0]
             # assert "movieId" in ratings[0]
@@ -1324,13 +4044,227 @@ class Tests:
                 assert isinstance(rating["rating"], float)
                 assert isinstance(rating["timestamp"], int)
 
+        def test_rating_store_columns(self, ratings_obj):
+            store = ratings_obj.ratings
+            assert len(store.user_ids) == len(store.movie_ids) == len(store.rating_values) == len(store.timestamps)
+            assert store.nbytes() == 20 * len(store)
+            if len(store):
+                assert store[0] == next(iter(store))
+
+        def test_memory_comparison(self, ratings_obj):
+            result = ratings_obj.ratings.memory_comparison()
+            assert result["rows"] == len(ratings_obj.ratings)
+            assert result["columnar_bytes"] < result["dict_list_bytes"]
+            assert result["ratio"] > 10
+
+        def test_ratings_full_file(self):
+            ratings_obj = Ratings(Tests.RATINGS_FILE, Tests.MOVIES_FILE, None, count_lines=None, chunk_size=100)
+            assert len(ratings_obj.ratings) == len(read_csv_as_dict(Tests.RATINGS_FILE))
+
+        def test_ratings_from_cache(self, ratings_obj):
+            cached = Ratings(Tests.RATINGS_FILE, Tests.MOVIES_FILE, set(ratings_obj.movie_titles))
+            fresh = Ratings(Tests.RATINGS_FILE, Tests.MOVIES_FILE, set(ratings_obj.movie_titles), use_cache=False)
+            assert list(cached.ratings) == list(fresh.ratings)
+            assert cached.movies == fresh.movies
+
+        def test_ratings_append(self, tmp_path):
+            lines = open(Tests.RATINGS_FILE, encoding='utf-8').read().splitlines(keepends=True)
+            path = tmp_path / "ratings.csv"
+            path.write_text("".join(lines[:len(lines) // 2]), encoding='utf-8')
+            ratings = Ratings(str(path), Tests.MOVIES_FILE, None, count_lines=None, use_cache=False)
+            ratings.movie_stats, ratings.user_stats, ratings.rating_years, ratings.rating_genre_masks, ratings.build_cube()
+            ratings.time_series("week")
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write("".join(lines[len(lines) // 2:]) + "1,1,4.0")  # последняя строка еще не дописана
+            assert ratings.append_file() == len(lines) - len(lines) // 2
+            assert ratings.append_file() == 0
+            fresh = Ratings(Tests.RATINGS_FILE, Tests.MOVIES_FILE, None, count_lines=None, use_cache=False)
+            assert list(ratings.ratings) == list(fresh.ratings)
+            assert ratings.movie_stats.counts == fresh.movie_stats.counts
+            assert ratings.movie_stats.sums == fresh.movie_stats.sums
+            assert ratings.movie_stats.sums_sq == fresh.movie_stats.sums_sq
+            for mid in fresh.movie_stats.counts:
+                assert ratings.movie_stats.variance(mid) == fresh.movie_stats.variance(mid)
+            assert {uid: (s.count, s.mean, s.variance) for uid, s in ratings.user_stats.stats.items()} == \
+                   {uid: (s.count, s.mean, s.variance) for uid, s in fresh.user_stats.stats.items()}
+            assert ratings.rating_years == fresh.rating_years
+            assert ratings.rating_months == fresh.rating_months
+            assert ratings.rating_genre_masks == fresh.rating_genre_masks
+            assert ratings.cube.cells == fresh.build_cube().cells
+            assert ratings.time_series("week").movies == fresh.time_series("week").movies
+            movie_id = fresh.ratings.movie_ids[0]
+            assert ratings.append([{"userId": "7", "movieId": str(movie_id), "rating": "4.5", "timestamp": "964982703"}]) == 1
+            assert ratings.movie_stats.counts[movie_id] == fresh.movie_stats.counts[movie_id] + 1
+            path.write_text("".join(lines[:2]), encoding='utf-8')  # файл перезаписан
+            with pytest.raises(ValueError):
+                ratings.append_file()
+
+        def test_load_stops_at_offset(self, tmp_path):
+            lines = open(Tests.RATINGS_FILE, encoding='utf-8').read().splitlines(keepends=True)[:11]
+            path = tmp_path / "ratings.csv"
+            path.write_text("".join(lines[:6]), encoding='utf-8')
+            offset = os.path.getsize(path)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write("".join(lines[6:]))  # дописано во время загрузки
+            rows = [row for chunk in read_csv_chunks(str(path), end=offset) for row in chunk]
+            assert len(rows) == 5
+            tail, new_offset = read_csv_tail(str(path), offset)
+            assert len(tail) == 5 and new_offset == os.path.getsize(path)
+            columns = read_columns_parallel(str(path), workers=2, end=offset)
+            assert len(columns["movieId"]) == 5
+
+        def test_time_series(self, ratings_obj):
+            store = ratings_obj.ratings
+            days = Counter(datetime.fromtimestamp(ts, tz=timezone.utc).date() for ts in store.timestamps)
+            series = ratings_obj.time_series("day")
+            assert ratings_obj.time_series("day") is series
+            single = series.rolling(1)
+            assert {d: count for d, (count, _) in single.items() if count} == days
+            weekly = series.rolling(3, start=min(days), end=max(days))
+            for start, (count, _) in list(weekly.items())[:50]:
+                assert count == sum(days[start - timedelta(days=i)] for i in range(3))
+            movie_id = store.movie_ids[0]
+            movie_days = Counter(datetime.fromtimestamp(ts, tz=timezone.utc).date()
+                                 for mid, ts in zip(store.movie_ids, store.timestamps) if mid == movie_id)
+            assert {d: c for d, (c, _) in series.rolling(1, movie_id).items() if c} == movie_days
+            monthly = ratings_obj.Movies(ratings_obj, ratings_obj.movies).rolling_ratings("month", window=12)
+            assert all(start.day == 1 for start in monthly)
+            last = max(days)
+            recent = Counter(mid for mid, ts in zip(store.movie_ids, store.timestamps)
+                             if last - timedelta(days=29) <= datetime.fromtimestamp(ts, tz=timezone.utc).date())
+            # при равных счетчиках порядок фильмов может отличаться
+            assert [c for _, c in series.trending(5, window=30)] == [c for _, c in top_n(recent.items(), 5)]
+
+        def test_movie_index(self, ratings_obj):
+            store = ratings_obj.ratings
+            index = ratings_obj.movie_index
+            assert list(index.ids) == sorted(set(store.movie_ids))
+            assert sorted(index.order) == list(range(len(store)))
+            for mid in list(index.ids)[:20]:
+                assert list(index.rows(mid)) == [i for i, m in enumerate(store.movie_ids) if m == mid]
+            assert len(index.rows(-1)) == 0
+            some = set(list(index.ids)[::3])
+            expected = [r for m, r in zip(store.movie_ids, store.rating_values) if m in some]
+            assert ratings_obj.get_ratings_for_movies(some) == expected
+            assert ratings_obj.get_ratings_for_movies([]) == []
+
+        def test_rating_matrix(self, ratings_obj):
+            matrix = ratings_obj.rating_matrix
+            assert matrix is ratings_obj.rating_matrix
+            store = ratings_obj.ratings
+            assert matrix.shape == (len(set(store.user_ids)), len(set(store.movie_ids)))
+            assert matrix.nnz == matrix.indptr[-1] == len(set(zip(store.user_ids, store.movie_ids)))
+            user_id = store.user_ids[0]
+            expected = {m: r for u, m, r in zip(store.user_ids, store.movie_ids, store.rating_values) if u == user_id}
+            assert matrix.user_row(user_id) == expected
+            assert matrix.user_row(-1) == {}
+            for i in range(len(matrix.user_ids)):
+                row = matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]]
+                assert list(row) == sorted(row)
+
+        def test_rating_matrix_append(self):
+            ratings = Ratings(Tests.RATINGS_FILE, Tests.MOVIES_FILE, None, use_cache=False)
+            before = ratings.rating_matrix
+            user_id = max(ratings.ratings.user_ids) + 1
+            movie_id = ratings.ratings.movie_ids[0]
+            assert ratings.append([{"userId": str(user_id), "movieId": str(movie_id), "rating": "4.5",
+                                    "timestamp": "964982703"}]) == 1
+            matrix = ratings.rating_matrix
+            assert matrix is not before
+            assert matrix.shape == (before.shape[0] + 1, before.shape[1])
+            assert matrix.nnz == before.nnz + 1
+            assert matrix.user_row(user_id) == {movie_id: 4.5}
+
+        def test_rating_matrix_scipy(self, ratings_obj):
+            pytest.importorskip("scipy.sparse")
+            matrix = ratings_obj.rating_matrix
+            csr = matrix.to_scipy()
+            assert csr.shape == matrix.shape and csr.nnz == matrix.nnz
+            np = pytest.importorskip("numpy")
+            assert np.shares_memory(csr.data, np.frombuffer(matrix.data, dtype=np.float32))
+            user_id = matrix.user_ids[0]
+            row = csr.getrow(0)
+            assert {matrix.movie_ids[c]: float(v) for c, v in zip(row.indices, row.data)} == matrix.user_row(user_id)
+
+        @pytest.mark.parametrize("method", ["cosine", "adjusted_cosine"])
+        def test_item_similarity(self, ratings_obj, method):
+            store = ratings_obj.ratings
+            # как в RatingMatrix: для повторной пары остается последняя оценка
+            cells = {(uid, mid): rating for uid, mid, rating in zip(store.user_ids, store.movie_ids, store.rating_values)}
+            user_ratings = defaultdict(list)
+            for (uid, _), rating in cells.items():
+                user_ratings[uid].append(rating)
+            vectors = defaultdict(dict)
+            for (uid, mid), rating in cells.items():
+                shift = mean(user_ratings[uid]) if method == "adjusted_cosine" else 0
+                vectors[mid][uid] = rating - shift
+
+            def cosine(a, b):
+                dot = sum(a[u] * b[u] for u in a.keys() & b.keys())
+                norm = (sum(v * v for v in a.values()) * sum(v * v for v in b.values())) ** 0.5
+                return dot / norm if norm else 0
+
+            similarity = ItemSimilarity.build(ratings_obj, method, k=5, block_size=7, workers=1)
+            for mid in sorted(vectors)[:10]:
+                expected = sorted((cosine(vectors[mid], vectors[other]) for other in vectors
+                                   if other != mid and vectors[mid].keys() & vectors[other].keys()
+                                   and any(vectors[mid].values()) and any(vectors[other].values())),
+                                  reverse=True)[:5]
+                assert [score for _, score in similarity.similar(mid)] == pytest.approx(expected, abs=1e-6)
+            parallel = ItemSimilarity.build(ratings_obj, method, k=5, block_size=7, workers=2)
+            assert parallel.columns() == similarity.columns()
+
+        def test_adjusted_cosine_matrix_means(self, tmp_path):
+            lines = open(Tests.RATINGS_FILE, encoding='utf-8').read().splitlines(keepends=True)[:200]
+            path = tmp_path / "ratings.csv"
+            # повторная оценка той же пары: в матрице остается последняя
+            user_id, movie_id, rating, timestamp = lines[1].strip().split(",")
+            path.write_text("".join(lines) + f"{user_id},{movie_id},{float(rating) % 5 + 0.5},{timestamp}\n",
+                            encoding='utf-8')
+            ratings = Ratings(str(path), Tests.MOVIES_FILE, None, use_cache=False)
+            matrix = ratings.rating_matrix
+            assert matrix.nnz < len(ratings.ratings)
+            vectors = defaultdict(dict)
+            for u, uid in enumerate(matrix.user_ids):
+                start, end = matrix.indptr[u], matrix.indptr[u + 1]
+                row_mean = mean(matrix.data[start:end])
+                for col, rating in zip(matrix.indices[start:end], matrix.data[start:end]):
+                    vectors[matrix.movie_ids[col]][uid] = rating - row_mean
+            similarity = ItemSimilarity.build(ratings, "adjusted_cosine", k=3, workers=1)
+            for mid, vector in vectors.items():
+                for other, score in similarity.similar(mid):
+                    dot = sum(vector[u] * vectors[other][u] for u in vector.keys() & vectors[other].keys())
+                    norm = (sum(v * v for v in vector.values()) * sum(v * v for v in vectors[other].values())) ** 0.5
+                    assert score == pytest.approx(dot / norm, abs=1e-6)
+            assert ratings.item_similarity("adjusted_cosine", k=3).columns() == similarity.columns()
+            report = ItemSimilarity.benchmark(ratings, sample=10, workers=2)
+            assert report["pairs"] == sum(n * n for n in map(len, (matrix.user_row(u) for u in matrix.user_ids)))
+            assert report["workers"] == 2 and report["estimated_s"] >= 0
+
+        def test_item_similarity_cache(self, ratings_obj):
+            first = ratings_obj.item_similarity(k=5)
+            assert ratings_obj.item_similarity(k=5) is first
+            reloaded = Ratings(Tests.RATINGS_FILE, Tests.MOVIES_FILE, set(ratings_obj.movie_titles)).item_similarity(k=5)
+            assert isinstance(reloaded.neighbours, memoryview)
+            assert reloaded.columns() == first.columns()
+            movie_id = first.movie_ids[0]
+            ratings_movies = ratings_obj.Movies(ratings_obj, ratings_obj.movies)
+            assert len(ratings_movies.similar_movies(movie_id, n=3)) <= 3
+
         def test_ratings_init_movie_titles(self, ratings_obj):
 
-            assert isinstance(ratings_obj.movie_titles, dict)
+            assert isinstance(ratings_obj.movie_titles, Mapping)
             assert all(isinstance(i, int) for i in ratings_obj.movie_titles.keys())
             assert all(isinstance(i, str) for i in ratings_obj.movie_titles.values())
 
 
+        def test_shared_catalog(self, ratings_obj):
+            movies = Movies(Tests.MOVIES_FILE)
+            assert movies.catalog is ratings_obj.catalog
+            assert ratings_obj.movies is movies.get_movies()
+            with pytest.raises(TypeError):
+                ratings_obj.catalog.titles[1] = "changed"
+
         def test_ratings_init_movies(self, ratings_obj):
 
             assert isinstance(ratings_obj.movies, list)
@@ -1370,6 +4304,94 @@ class Tests:
             def ratings_movies_obj(self, ratings_obj):
                 return ratings_obj.Movies(ratings_obj, ratings_obj.movies)
 
+            def test_movie_stats(self, ratings_obj):
+                stats = ratings_obj.movie_stats
+                assert stats is ratings_obj.movie_stats
+                scores = defaultdict(list)
+                for mid, rating in zip(ratings_obj.ratings.movie_ids, ratings_obj.ratings.rating_values):
+                    scores[mid].append(rating)
+                assert stats.counts == {mid: len(values) for mid, values in scores.items()}
+                for mid, values in scores.items():
+                    assert stats.mean(mid) == mean(values)
+                    assert stats.median(mid) == median(values)
+                    # независимая точная дисперсия: совпадает до последнего бита
+                    if len(values) > 1:
+                        assert stats.variance(mid) == statistics.variance(values)
+
+            def test_top_controversial_rounding(self, tmp_path):
+                path = tmp_path / "ratings.csv"
+                movie_id = next(iter(MovieCatalog.load(Tests.MOVIES_FILE, max_lines=1000).titles))
+                rows = [f"{user},{movie_id},{rating},964982703"
+                        for user, rating in enumerate([5.0, 0.5, 4.0, 2.0, 3.5], 1)]
+                path.write_text("userId,movieId,rating,timestamp\n" + "\n".join(rows) + "\n", encoding='utf-8')
+                ratings = Ratings(str(path), Tests.MOVIES_FILE, None, use_cache=False)
+                movies = ratings.Movies(ratings, ratings.movies)
+                # точная дисперсия 3.125 округляется до 3.12, а не 3.13
+                assert list(movies.top_controversial(1).values()) == [3.12]
+                assert RunningStats([5.0, 0.5, 4.0, 2.0, 3.5]).variance == 3.125
+
+            def test_rating_cube(self, ratings_obj):
+                ratings_movies = ratings_obj.Movies(ratings_obj, ratings_obj.movies)
+                ratings_users = ratings_obj.Users(ratings_obj, ratings_obj.movies)
+                queries = [(None, None), ("Drama", None), ("Comedy", 1995), (None, 1995), ("Unknown", None)]
+                scanned = [ratings_movies.average_genre_rating_by_year(g, y) for g, y in queries]
+                trends = [ratings_users.genre_rating_trend_by_year(g) for g in ("Drama", "Comedy")]
+                cube = ratings_obj.build_cube()
+                try:
+                    assert [ratings_movies.average_genre_rating_by_year(g, y) for g, y in queries] == scanned
+                    assert [ratings_users.genre_rating_trend_by_year(g) for g in ("Drama", "Comedy")] == trends
+                    total = cube.rollup(by=())
+                    assert total[()]["count"] == len(ratings_obj.ratings)
+                    by_genre = cube.rollup(by="genre")
+                    assert by_genre["Drama"]["count"] == sum(cell["count"] for cell in scanned[1].values())
+                    by_years = cube.rollup(by=("release_year", "rating_year"), genre="Comedy")
+                    assert sum(cell["count"] for cell in by_years.values()) == by_genre["Comedy"]["count"]
+                finally:
+                    ratings_obj.cube = None
+
+            def test_quantile_sketches(self, ratings_obj):
+                sketched = Ratings(Tests.RATINGS_FILE, Tests.MOVIES_FILE, set(ratings_obj.movie_titles),
+                                   quantiles="sketch")
+                for metric in ("median", "p90"):
+                    exact = ratings_obj.Movies(ratings_obj, ratings_obj.movies).top_by_ratings(10, metric)
+                    assert sketched.Movies(sketched, sketched.movies).top_by_ratings(10, metric) == exact
+                    exact = ratings_obj.Users(ratings_obj, ratings_obj.movies).dist_by_user_rating(metric)
+                    assert sketched.Users(sketched, sketched.movies).dist_by_user_rating(metric) == exact
+                chunks = read_csv_chunks(Tests.RATINGS_FILE, chunk_size=100, valid_movie_ids=set(ratings_obj.movie_titles),
+                                         count_lines=1000)
+                streamed = MovieStats.from_chunks(chunks)
+                assert streamed.counts == ratings_obj.movie_stats.counts
+                for mid in streamed.counts:
+                    assert streamed.median(mid) == pytest.approx(ratings_obj.movie_stats.median(mid))
+                streamed_users = UserStats.from_chunks(read_csv_chunks(Tests.RATINGS_FILE, chunk_size=100, count_lines=50))
+                assert sum(s.count for s in streamed_users.stats.values()) == 50
+
+            def test_streaming(self, ratings_obj):
+                movie_ids = set(ratings_obj.movie_titles)
+                streamed = Ratings(Tests.RATINGS_FILE, Tests.MOVIES_FILE, movie_ids, chunk_size=100,
+                                   quantiles="sketch", streaming=True)
+                assert streamed.ratings is None
+                assert streamed.movie_stats.counts == ratings_obj.movie_stats.counts
+                movies = streamed.Movies(streamed, streamed.movies)
+                exact_movies = ratings_obj.Movies(ratings_obj, ratings_obj.movies)
+                users = streamed.Users(streamed, streamed.movies)
+                exact_users = ratings_obj.Users(ratings_obj, ratings_obj.movies)
+                for metric in ("average", "median", "p90"):
+                    assert movies.top_by_ratings(10, metric) == exact_movies.top_by_ratings(10, metric)
+                    assert users.dist_by_user_rating(metric) == exact_users.dist_by_user_rating(metric)
+                assert movies.top_by_num_of_ratings(10) == exact_movies.top_by_num_of_ratings(10)
+                assert movies.dist_by_rating() == exact_movies.dist_by_rating()
+                assert users.dist_by_num_of_ratings() == exact_users.dist_by_num_of_ratings()
+                movie_id = next(iter(streamed.movie_stats.counts))
+                count = streamed.movie_stats.counts[movie_id]
+                assert streamed.append([{"userId": "7", "movieId": str(movie_id), "rating": "4.5",
+                                         "timestamp": "964982703"}]) == 1
+                assert streamed.movie_stats.counts[movie_id] == count + 1
+                with pytest.raises(ValueError):
+                    movies.dist_by_year()
+                with pytest.raises(ValueError):
+                    users.user_history(7)
+
             def test_dist_by_year(self, ratings_movies_obj):
 
                 result = ratings_movies_obj.dist_by_year()
@@ -1516,6 +4538,36 @@ class Tests:
                 assert result == answer
 
 
+            def test_genre_rating_trend_approx(self, ratings_obj, ratings_users_obj):
+                exact = ratings_users_obj.genre_rating_trend_by_year("Drama")
+                approx = ratings_users_obj.genre_rating_trend_by_year("Drama", distinct="approx")
+                assert exact.keys() == approx.keys()
+                for year, data in exact.items():
+                    assert approx[year]["оценок"] == data["оценок"]
+                    assert abs(approx[year]["пользователей"] - data["пользователей"]) <= max(1, 0.05 * data["пользователей"])
+                ratings_obj.build_cube(distinct="approx")
+                try:
+                    assert ratings_users_obj.genre_rating_trend_by_year("Drama", distinct="approx") == approx
+                    assert ratings_users_obj.genre_rating_trend_by_year("Drama") == exact
+                finally:
+                    ratings_obj.cube = None
+
+            def test_user_index(self, ratings_obj, ratings_users_obj):
+                store = ratings_obj.ratings
+                user_id = store.user_ids[0]
+                rows = [i for i, uid in enumerate(store.user_ids) if uid == user_id]
+                history = ratings_users_obj.user_history(user_id)
+                assert history == [{"movieId": store.movie_ids[i], "rating": store.rating_values[i],
+                                    "timestamp": store.timestamps[i]} for i in rows]
+                span = ratings_users_obj.activity_span(user_id)
+                assert span["count"] == len(rows)
+                assert span["first"] <= span["last"]
+                assert span["first"].tzinfo is ratings_obj.tz
+                assert ratings_users_obj.user_history(-1) == [] and ratings_users_obj.activity_span(-1) is None
+                stats = ratings_obj.user_stats.stats[user_id]
+                values = [store.rating_values[i] for i in rows]
+                assert stats.count == len(values) and stats.mean == mean(values)
+
             def test_genre_rating_trend_by_year(self, ratings_users_obj):
                 """Тестирование трендов рейтинга по жанрам"""
                 result1 = ratings_users_obj.genre_rating_trend_by_year("Thriller")
@@ -1546,6 +4598,17 @@ class Tests:
             movie_ids = set(int(m["movieId"]) for m in movies_list)
             return Tags(Tests.TAGS_FILE, movie_ids)
 
+        def test_tags_append(self, tags_obj):
+            tag = "appended tag for test"
+            movie_id = min(tags_obj.valid_movie_ids)
+            popular = tags_obj.most_popular(1)
+            assert tags_obj.append([{"userId": "1", "movieId": str(movie_id), "tag": tag, "timestamp": "0"},
+                                    {"userId": "1", "movieId": "-1", "tag": "unknown movie", "timestamp": "0"}]) == 1
+            assert tag in tags_obj.tags and tags_obj.tag_list[-1] == tag
+            assert tags_obj.movie_tags[movie_id][-1] == tag
+            assert tags_obj.tag_counts[tag] == 1
+            assert tags_obj.most_popular(1) == popular
+
         def test_tags_init(self, tags_obj):
             """Тестирование инициализации класса Tags"""
             assert isinstance(tags_obj.tags, set)